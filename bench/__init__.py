@@ -0,0 +1,5 @@
+# Microbenchmarks for MidiCube, runnable without a cube or ALSA:
+#
+#   python -m bench.run [--json results.json] [--only name,...]
+#
+# The fake module provides the ALSA sequencer and Bluetooth stand-ins.
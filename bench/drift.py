@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+# Drift check of the free-running arpeggiator on a virtual clock. Every
+# timer event fires up to 2 ms late, like a loaded machine would; the
+# deadlines of 10,000 notes must still sit exactly on the tempo grid,
+# also across a tempo change from the speed behavior half way through.
+#
+#   python -m bench.drift
+
+import sys
+import random
+
+from bench import fake
+fake.install()
+
+import log
+import clock
+import command
+
+from params import Params
+from scheduler import Scheduler
+from output import Output, Backend
+
+NOTES = 10000
+LATENESS = 0.002
+TOLERANCE = 1e-6
+
+# collects the deadlines of the notes
+class Deadlines (Backend):
+    timed = True
+
+    def __init__(self):
+        self.deadlines = []
+
+    def write(self, steps):
+        for (out, due, cause) in steps:
+            for event in out:
+                if event[0] == fake.SND_SEQ_EVENT_NOTEON:
+                    self.deadlines.append(due)
+
+# virtual wheel firing every event late by a random amount
+class LateWheel (clock.VirtualWheel):
+    def __init__(self, seed=1):
+        clock.VirtualWheel.__init__(self)
+        self.random = random.Random(seed)
+
+    def advance(self, when):
+        while True:
+            with self.lock:
+                if not self.heap or self.heap[0].when > when:
+                    break
+                event = self.heap[0]
+                self._remove(event)
+            self.now.time = max(self.now.time, event.when + self.random.uniform(0, LATENESS))
+            self.due = event.when
+            event.action(*event.args)
+        self.now.time = max(self.now.time, when)
+
+def run():
+    p = Params()
+    p.arp = True
+    p.setSpeed = True
+    p.status = False
+    p.lfos = []
+    p.controllers = []
+    p.triggerCCs = []
+    wheel = LateWheel()
+    backend = Deadlines()
+    deadlines = backend.deadlines
+    s = Scheduler(p, wheel=wheel, output=Output(backend, threaded=False))
+    s.handle(command.PSH_NOTE, 48)
+    s.handle(command.SET_POT, 200)
+    s.handle(command.TRG_ON, None, 0.0)
+    rate1 = s.grid.rate
+    # play half of the notes, then change the tempo between two beats
+    change = (NOTES / 2 - 0.5) / rate1
+    wheel.advance(change)
+    s.handle(command.SET_POT, 700)
+    rate2 = s.grid.rate
+    wheel.advance(change + (NOTES / 2) / rate2)
+    s.handle(command.TRG_OFF, None)
+    # expected grid: n / rate1 up to the change, then the rest of the
+    # beat in progress and the following beats at rate2
+    phase = change * rate1
+    drift = 0.0
+    for n, due in enumerate(deadlines[:NOTES]):
+        if n < phase:
+            expected = n / rate1
+        else:
+            expected = change + (n - phase) / rate2
+        drift = max(drift, abs(due - expected))
+    return len(deadlines), 60 * rate1, 60 * rate2, drift
+
+if __name__ == '__main__':
+    log.setup(level='off')
+    (notes, bpm1, bpm2, drift) = run()
+    print "%i notes at %.1f and %.1f BPM, timers up to %.1f ms late" % (notes, bpm1, bpm2, 1000 * LATENESS)
+    print "max deviation from the tempo grid: %.3g s" % drift
+    if notes < NOTES or drift > TOLERANCE:
+        print "FAILED"
+        sys.exit(1)
+    print "OK"
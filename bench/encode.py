@@ -0,0 +1,59 @@
+#!/usr/bin/python
+
+# Microbenchmark for MIDI event construction: builds the events of one
+# arpeggio step (note off, note on, trigger CCs, bend reset) with the
+# plain util builders and with the cached encoder, one list per step,
+# and reports events/sec.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import events
+
+from util import *
+
+TRIGGER_CCS = [20, 21, -22]
+STEPS = 20000
+
+def buildPlain(output):
+    for i in xrange(STEPS):
+        pitch = 36 + i % 24
+        out = [noteOffEvent(Note(pitch - 1), chan=1)]
+        for cc in TRIGGER_CCS:
+            out.append(ccEvent(cc, 0, chan=1))
+        out.append(noteOnEvent(Note(pitch), chan=1))
+        for cc in TRIGGER_CCS:
+            out.append(ccEvent(cc, 127, chan=1))
+        out.append(pitchBendEvent(8192, chan=1))
+        output(out)
+
+def buildCached(output):
+    triggerOn = events.controlGroup(TRIGGER_CCS, 127, chan=1)
+    triggerOff = events.controlGroup(TRIGGER_CCS, 0, chan=1)
+    for i in xrange(STEPS):
+        pitch = 36 + i % 24
+        out = events.Batch()
+        out.add(events.noteOff(pitch - 1, chan=1))
+        out.extend(triggerOff)
+        out.add(events.noteOn(pitch, chan=1))
+        out.extend(triggerOn)
+        out.add(events.bend(8192, chan=1))
+        output(out)
+
+def rate(build, repeat=5):
+    sink = []
+    def run():
+        del sink[:]
+        build(sink.append)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return sum(map(len, sink)) / best
+
+if __name__ == '__main__':
+    plain = rate(buildPlain)
+    cached = rate(buildCached)
+    print "plain builders : %10.0f events/s" % plain
+    print "cached         : %10.0f events/s" % cached
+    print "speedup        : %10.2fx" % (cached / plain)
@@ -0,0 +1,106 @@
+# Stand-ins for the ALSA sequencer and Bluetooth modules, so that the
+# MidiCube sources can be imported and driven on a plain Linux box. The
+# fake sequencer only counts the events written to it; the fake RFCOMM
+# socket serves prepared data in fixed-size chunks.
+
+import os
+import sys
+import types
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# ALSA event types as used by alsain
+SND_SEQ_EVENT_NOTEON  = 6
+SND_SEQ_EVENT_NOTEOFF = 7
+SND_SEQ_EVENT_START   = 30
+SND_SEQ_EVENT_STOP    = 32
+SND_SEQ_EVENT_CLOCK   = 36
+
+class Sequencer:
+    def __init__(self):
+        self.written = 0
+        self.pending = []
+
+    def output(self, event):
+        self.written += 1
+
+    def inputpending(self):
+        return len(self.pending)
+
+    def input(self):
+        return self.pending.pop(0)
+
+sequencer = Sequencer()
+
+def alsaseqModule():
+    m = types.ModuleType('alsaseq')
+    for name in ['SND_SEQ_EVENT_NOTEON', 'SND_SEQ_EVENT_NOTEOFF', 'SND_SEQ_EVENT_START',
+                 'SND_SEQ_EVENT_STOP', 'SND_SEQ_EVENT_CLOCK']:
+        setattr(m, name, globals()[name])
+    m.output = lambda event: sequencer.output(event)
+    m.inputpending = lambda: sequencer.inputpending()
+    m.input = lambda: sequencer.input()
+    m.fd = lambda: Readable.fd()
+    m.client = m.connectto = m.connectfrom = lambda *args: None
+    return m
+
+class BluetoothError (IOError):
+    pass
+
+def bluetoothModule():
+    m = types.ModuleType('bluetooth')
+    m.BluetoothError = BluetoothError
+    m.btcommon = m
+    m.RFCOMM = 3
+    m.discover_devices = lambda: []
+    m.lookup_name = lambda address: None
+    return m
+
+# install the fake modules in place of the real ones and make the
+# sources importable; must be called before importing any of them
+def install():
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    sys.modules['alsaseq'] = alsaseqModule()
+    sys.modules['alsamidi'] = types.ModuleType('alsamidi')
+    sys.modules['bluetooth'] = bluetoothModule()
+
+# a file descriptor that always polls readable
+class Readable:
+    pipe = None
+
+    @classmethod
+    def fd(cls):
+        if cls.pipe is None:
+            cls.pipe = os.pipe()
+            os.write(cls.pipe[1], 'x')
+        return cls.pipe[0]
+
+# RFCOMM socket replacement serving data in chunks of the given size,
+# then reporting the connection as closed
+class Socket:
+    def __init__(self, data, chunk=64):
+        self.data = bytearray(data)
+        self.chunk = chunk
+        self.offset = 0
+
+    def fileno(self):
+        return Readable.fd()
+
+    def recv_into(self, buf):
+        n = min(self.chunk, len(buf), len(self.data) - self.offset)
+        buf[0:n] = self.data[self.offset:self.offset+n]
+        self.offset += n
+        return n
+
+    def recv(self, size):
+        n = min(self.chunk, size, len(self.data) - self.offset)
+        data = str(self.data[self.offset:self.offset+n])
+        self.offset += n
+        return data
+
+    def rewind(self):
+        self.offset = 0
+
+    def close(self):
+        pass
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+
+# Quantised arpeggio on an incoming MIDI clock, on a virtual clock: 120
+# BPM ticks arrive 3 ms late with +-2 ms of uniform jitter. Notes struck
+# by their tick carry that jitter; once the clock follower is locked,
+# notes are struck ahead at the predicted tick and must land within a
+# tighter spread around the tick grid, from the first prediction on.
+# The clock is run with several jitter sequences, as how fast the
+# follower converges depends on the first few intervals.
+#
+#   python -m bench.follow
+
+import sys
+import random
+
+from bench import fake
+fake.install()
+
+import log
+import clock
+import command
+
+from params import Params
+from scheduler import Scheduler
+from output import Output, Backend
+
+BPM = 120
+TICKS = 2000
+RUNS = 20
+DELAY = 0.003
+JITTER = 0.002
+FIRST = 10              # predictions counted as the first after lock
+TOLERANCE = 0.002       # allowed spread of the predicted notes
+
+# collects the deadlines of the notes
+class Deadlines (Backend):
+    timed = True
+
+    def __init__(self):
+        self.deadlines = []
+
+    def write(self, steps):
+        for (out, due, cause) in steps:
+            for event in out:
+                if event[0] == fake.SND_SEQ_EVENT_NOTEON:
+                    self.deadlines.append(due)
+
+def spread(errors):
+    if not errors:
+        return 0.0
+    return max(errors) - min(errors)
+
+def run(seed=1):
+    p = Params()
+    p.arp = True
+    p.quant = True
+    p.status = False
+    p.lfos = []
+    p.controllers = []
+    p.triggerCCs = []
+    rnd = random.Random(seed)
+    period = 60.0 / (BPM * 24)
+    wheel = clock.VirtualWheel()
+    backend = Deadlines()
+    s = Scheduler(p, wheel=wheel, output=Output(backend, threaded=False))
+    s.handle(command.PSH_NOTE, 48)
+    s.handle(command.PSH_NOTE, 52)
+    s.handle(command.TRG_ON, None, 0.0)
+    s.handle(command.TRP_START, None, 0.0)
+    mod = s.state.tickMod
+    stamps = set()
+    for i in range(1, TICKS):
+        stamp = i * period + DELAY + rnd.uniform(-JITTER, JITTER)
+        wheel.advance(stamp)
+        s.handle(command.TRP_TICK, None, stamp)
+        stamps.add(stamp)
+    s.handle(command.TRG_OFF, None, wheel.now())
+    # notes struck by their tick have its arrival stamp as deadline, all
+    # later ones were predicted; trigger and transport start strike at 0
+    struck, predicted = [], []
+    for due in [d for d in backend.deadlines if d > 0.0]:
+        k = round((due - DELAY) / (mod * period))
+        error = due - DELAY - k * mod * period
+        (struck if due in stamps else predicted).append(error)
+    steady = predicted[len(predicted) / 2:]
+    return (len(backend.deadlines), s.follower.bpm(), struck,
+            predicted[:FIRST], steady)
+
+if __name__ == '__main__':
+    log.setup(level='off')
+    notes, struck, first, steady = 0, [], [], []
+    for seed in range(1, RUNS + 1):
+        result = run(seed)
+        notes += result[0]
+        struck += result[2]
+        first += result[3]
+        steady += result[4]
+    print "%i runs, %i notes, %i struck by their tick, clock read as %.2f BPM" % (
+        RUNS, notes, len(struck), result[1])
+    print "spread struck by tick: %.2f ms" % (1000 * spread(struck))
+    print "spread of the first %i predictions: %.2f ms (max error %.2f ms)" % (
+        FIRST, 1000 * spread(first), 1000 * max([abs(e) for e in first] or [0.0]))
+    print "spread in steady state: %.2f ms" % (1000 * spread(steady))
+    if not first or spread(first) > TOLERANCE or spread(steady) > TOLERANCE:
+        print "FAILED"
+        sys.exit(1)
+    print "OK"
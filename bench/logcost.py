@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+# Cost of a debug log call with the old synchronous file handler, the
+# asynchronous handler and log.debug(), which queues a compact tuple
+# instead of a LogRecord, and with debug logging switched off. Two costs
+# per event: on the calling (MIDI) thread, timed with the writer held
+# back since under the GIL its work would otherwise be charged to the
+# caller, and in total, timed until the writer has written every record
+# to the file. The asynchronous handler has to win on both.
+
+import os
+import sys
+import logging
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import log
+
+N = 20000
+
+def configure(handler, level):
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+        h.close()
+    root.setLevel(level)
+    if handler is not None:
+        root.addHandler(handler)
+
+class Paused (log.AsyncHandler):
+    def write(self):
+        pass
+
+def cost(handler, level, eager, compact=False):
+    configure(handler, level)
+    log.handler = handler
+    log.debugging = handler is not None and level <= logging.DEBUG
+    if compact:
+        def run():
+            for i in xrange(N):
+                log.debug("send command %s", 'TRP_TICK')
+                log.debug("play note %s", (i, 127))
+    elif eager:
+        def run():
+            for i in xrange(N):
+                logging.debug("send command %s" % 'TRP_TICK')
+                logging.debug("play note %s" % str((i, 127)))
+    else:
+        def run():
+            for i in xrange(N):
+                logging.debug("send command %s", 'TRP_TICK')
+                logging.debug("play note %s", (i, 127))
+    def timed():
+        run()
+        if handler is not None:
+            handler.flush()     # the asynchronous writer is done
+        if isinstance(handler, Paused):
+            handler.records.clear()
+    best = min(timeit.repeat(timed, number=1, repeat=3))
+    return 1e6 * best / (2*N)
+
+if __name__ == '__main__':
+    path = os.path.join(tempfile.mkdtemp(), 'debug.log')
+    def fileHandler():
+        h = logging.FileHandler(path)
+        h.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        return h
+    print "%-32s %10s %10s" % ("us/event", "caller", "total")
+    old = cost(fileHandler(), logging.DEBUG, True)
+    print "%-32s %10.2f %10.2f" % ("sync file, eager format (old)", old, old)
+    log.compactRecords()
+    lazy = cost(fileHandler(), logging.DEBUG, False)
+    print "%-32s %10.2f %10.2f" % ("sync file, lazy format", lazy, lazy)
+    rows = [("async handler", logging.DEBUG, False),
+            ("log.debug", logging.DEBUG, True)]
+    for (name, level, compact) in rows:
+        caller = cost(Paused(fileHandler()), level, False, compact)
+        total = cost(log.AsyncHandler(fileHandler()), level, False, compact)
+        print "%-32s %10.2f %10.2f" % (name, caller, total)
+    for (name, compact) in [("level info, lazy format", False),
+                            ("log.debug, level info", True)]:
+        off = cost(None, logging.INFO, False, compact)
+        print "%-32s %10.2f %10.2f" % (name, off, off)
+    log.handler, log.debugging = None, False
+    configure(None, logging.WARNING)
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
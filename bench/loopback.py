@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+# Loopback check of both stream decoders through a socket pair: text
+# lines, binary position frames with a gap in the sequence numbers and a
+# corrupted frame are sent in small chunks and must decode unchanged.
+#
+#   python -m bench.loopback
+
+import sys
+import socket
+
+from bench import fake
+fake.install()
+
+from frame import LineDecoder, FrameDecoder, encodePos, FRAME_POS, POS_SCALE
+
+LINES = ['RUN OK', 'POT 512', 'TRG ON', 'POS 12.34,-5.67,8.90', 'TRG OFF']
+POSITIONS = [(12.34, -5.67, 8.9), (-90.0, 0.0, 90.0), (0.1, 2.57, -2.56)]
+
+# sends the data in chunks and feeds whatever arrives to the decoder
+def loopback(a, b, decoder, data, chunk=7):
+    out = []
+    for i in range(0, len(data), chunk):
+        b.sendall(data[i:i+chunk])
+        n = a.recv_into(decoder.space())
+        decoder.feed(n, out)
+    return out
+
+def run():
+    failures = []
+    def check(ok, what, got):
+        if not ok:
+            failures.append("%s: %r" % (what, got))
+    a, b = socket.socketpair()
+    text = bytearray(''.join([l + '\r\n' for l in LINES]))
+    out = loopback(a, b, LineDecoder(size=64), text)
+    check(out == LINES, "lines", out)
+    stream = bytearray(text)
+    for i, p in enumerate(POSITIONS):
+        stream += encodePos(i, *p)
+        stream += 'ALIVE\n'
+    stream += encodePos(7, 1, 2, 3)    # four frames lost (3 to 6)
+    decoder = FrameDecoder(size=64)
+    out = loopback(a, b, decoder, stream)
+    check(out[:len(LINES)] == LINES, "lines between frames", out)
+    frames = [m for m in out if isinstance(m, tuple)]
+    check(len(frames) == 4, "frames", frames)
+    for (kind, pos), expected in zip(frames, POSITIONS):
+        check(kind == FRAME_POS and all(abs(p - e) < POS_SCALE for p, e in zip(pos, expected)),
+              "position %r" % (expected,), pos)
+    check(out.count('ALIVE') == 3, "keepalives", out)
+    check(decoder.lost == 4 and decoder.errors == 0, "lost/errors", (decoder.lost, decoder.errors))
+    # corrupted frame is skipped, the following line survives
+    bad = encodePos(8, 1, 2, 3)
+    bad[4] ^= 0xFF
+    out = loopback(a, b, decoder, bad + bytearray('TRG ON\n'))
+    check(out == ['TRG ON'] and decoder.errors > 0, "corrupted frame", (out, decoder.errors))
+    return failures
+
+if __name__ == '__main__':
+    failures = run()
+    for f in failures:
+        print f
+    if failures:
+        print "FAILED"
+        sys.exit(1)
+    print "OK"
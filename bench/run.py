@@ -0,0 +1,247 @@
+#!/usr/bin/python
+
+# Scheduler microbenchmark suite. Drives the Scheduler, Arpeggiator, LFO
+# engine, event builders and Listener.readSock with synthetic workloads
+# against the fake sequencer and socket, and reports throughput and cost
+# per operation. Each workload is timed as the best of several runs.
+#
+#   python -m bench.run [--json results.json] [--only name,...] [--repeat n]
+
+import os
+import sys
+import time
+import json
+import getopt
+import platform
+import timeit
+
+from bench import fake
+fake.install()
+
+import log
+import sync
+import command
+import events
+import arpeg
+import frame
+
+from params import Params
+from scheduler import Scheduler
+from listener import Listener
+from lfo import LFO, LFOEngine
+from output import Output, AlsaBackend, NullBackend
+from util import *
+
+def params(**options):
+    p = Params()
+    p.controllers = []
+    p.lfos = []
+    p.triggerCCs = []
+    for name, value in options.items():
+        setattr(p, name, value)
+    return p
+
+# scheduler writing straight to the fake sequencer
+def scheduler(p, notes=[]):
+    s = Scheduler(p, output=Output(AlsaBackend(), threaded=False))
+    for n in notes:
+        s.handle(command.PSH_NOTE, n)
+    s.handle(command.TRG_ON, None)
+    return s
+
+# Workloads return a function running the workload once and the number
+# of operations it performs, plus optional extra result fields.
+
+def potSweep():
+    s = scheduler(params(setNote=True, setBend=True, setVelocity=True, gliss=True,
+                         controllers=[(1, 0), (2, 0), (-3, 0)], triggerCCs=[20]))
+    sweep = range(0, 1024, 4) + range(1023, -1, -4)
+    def run():
+        for x in sweep:
+            s.handle(command.SET_POT, x)
+    return run, len(sweep), {}
+
+def posSweep():
+    s = scheduler(params(setNote=True, axisNote=0, setBend=True, axisBend=1,
+                         controllers=[(1, 0), (2, 1), (3, 2)]))
+    positions = [(a, -a, a / 2.0) for a in range(-90, 91)]
+    def run():
+        for pos in positions:
+            s.handle(command.SET_POS, pos)
+    return run, len(positions), {}
+
+def denseChords():
+    s = scheduler(params(arp=True, quant=True, pattern='triangle', scale='C'))
+    s.state.tickMod = 1
+    chords = [range(root, root + 24, 3) for root in range(36, 72, 5)]
+    def run():
+        for chord in chords:
+            for n in chord:
+                s.handle(command.PSH_NOTE, n)
+            for i in range(8):
+                s.handle(command.TRP_TICK, None)
+            for n in chord:
+                s.handle(command.POP_NOTE, n)
+    return run, sum([2 * len(c) + 8 for c in chords]), {}
+
+# one minute of 24 ppqn MIDI clock at 300 BPM, arpeggio in sixteenths
+def clock300():
+    ticks = 300 * 24
+    s = scheduler(params(arp=True, quant=True, pattern='up'), notes=[48, 52, 55, 60])
+    s.handle(command.TRP_START, None)
+    s.state.tickMod = 6
+    def run():
+        for i in xrange(ticks):
+            s.handle(command.TRP_TICK, None)
+    return run, ticks, {'budget_us': 1e6 * 60.0 / ticks}
+
+def manyLfos():
+    waves = ['sin', 'tri', 'saw', 'sqr', 'wah']
+    p = params(lfoRate=100)
+    s = Scheduler(p)
+    engine = LFOEngine([LFO(cc, waves[cc % len(waves)]) for cc in range(64)], p, s.wheel)
+    engine.setFrequency(7.5)
+    engine.start()
+    samples = 1000
+    def run():
+        for i in xrange(samples):
+            engine.sample()
+    return run, samples, {'lfos': 64}
+
+def arpeggiator():
+    a = arpeg.Arpeggiator('1:3:5:2:4')
+    for n in range(40, 64, 2):
+        a.pushNote(n)
+    steps = 20000
+    def run():
+        for i in xrange(steps):
+            a.next()
+            a.getNote(i % 3)
+    return run, steps, {}
+
+def builders(cached):
+    steps = 5000
+    def plain():
+        for i in xrange(steps):
+            pitch = 36 + i % 24
+            fake.sequencer.output(noteOffEvent(Note(pitch - 1), chan=1))
+            fake.sequencer.output(noteOnEvent(Note(pitch), chan=1))
+            fake.sequencer.output(ccEvent(20, 127, chan=1))
+            fake.sequencer.output(pitchBendEvent(8192, chan=1))
+    def cache():
+        for i in xrange(steps):
+            pitch = 36 + i % 24
+            fake.sequencer.output(events.noteOff(pitch - 1, chan=1))
+            fake.sequencer.output(events.noteOn(pitch, chan=1))
+            fake.sequencer.output(events.control(20, 127, chan=1))
+            fake.sequencer.output(events.bend(8192, chan=1))
+    return (cached and cache or plain), 4 * steps, {}
+
+def readSock(binary):
+    messages = 2000
+    data = bytearray()
+    for i in range(messages / 4):
+        a = (i % 180) - 90.0
+        if binary:
+            data += frame.encodePos(i, a, -a, a / 2)
+        else:
+            data += 'POS %.2f,%.2f,%.2f\n' % (a, -a, a / 2)
+        data += 'POT %i\nTRG ON\nALIVE\n' % (i % 1024)
+    sock = fake.Socket(data, chunk=64)
+    listener = Listener(sock, None, binary=binary)
+    def run():
+        sock.rewind()
+        for i in xrange(messages):
+            listener.readSock()
+    return run, messages, {'bytes': len(data)}
+
+# producer side of the threaded output writer
+def outputRing():
+    out = Output(NullBackend())
+    out.start()
+    steps = 20000
+    step = [events.noteOff(59), events.noteOn(60)]
+    def run():
+        for i in xrange(steps):
+            out.write(step)
+    return run, steps, {}
+
+WORKLOADS = [('pot_sweep', potSweep),
+             ('pos_sweep', posSweep),
+             ('dense_chords', denseChords),
+             ('clock_300bpm', clock300),
+             ('lfo_bank_64', manyLfos),
+             ('arpeggiator', arpeggiator),
+             ('builders_plain', lambda: builders(False)),
+             ('builders_cached', lambda: builders(True)),
+             ('output_ring', outputRing),
+             ('readsock_text', lambda: readSock(False)),
+             ('readsock_binary', lambda: readSock(True))]
+
+# status lines of the scheduler go to /dev/null while measuring
+def measure(name, workload, repeat):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        run, ops, extra = workload()
+        written = fake.sequencer.written
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    result = {'name': name,
+              'ops': ops,
+              'seconds': best,
+              'ops_per_s': ops / best,
+              'us_per_op': 1e6 * best / ops,
+              'midi_events_per_run': (fake.sequencer.written - written) / repeat}
+    result.update(extra)
+    return result
+
+def usage():
+    print """python -m bench.run [options]
+--json <file>     write the results as JSON to file
+--only <names>    run only the comma separated workloads
+--repeat <n>      runs per workload, the best is reported (default: 5)
+--list            list the workloads"""
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "", ["json=", "only=", "repeat=", "list"])
+    except getopt.GetoptError:
+        usage()
+        return 2
+    output = None
+    only = None
+    repeat = 5
+    for opt, arg in opts:
+        if opt == "--json":
+            output = arg
+        elif opt == "--only":
+            only = arg.split(',')
+        elif opt == "--repeat":
+            repeat = int(arg)
+        elif opt == "--list":
+            for name, workload in WORKLOADS:
+                print name
+            return 0
+    log.setup(level='off')
+    results = []
+    print "%-18s %10s %12s %10s" % ("workload", "ops", "ops/s", "us/op")
+    for name, workload in WORKLOADS:
+        if only is not None and name not in only:
+            continue
+        r = measure(name, workload, repeat)
+        results.append(r)
+        print "%-18s %10i %12.0f %10.2f" % (name, r['ops'], r['ops_per_s'], r['us_per_op'])
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'repeat': repeat,
+                       'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
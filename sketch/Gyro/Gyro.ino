@@ -58,6 +58,8 @@ boolean trigger = false;     // trigger pressed
 boolean rapidfire = false;   // rapid fire switch enabled
 boolean triggerSend = false; // send trigger status update 
 boolean rfiSend = false;     // send rapid fire mode update
+boolean binary = false;      // send positions as binary frames
+byte    frameSeq = 0;        // sequence number of binary frames
 char    greenShade = 0;      // PWM value for green LED (pulsates in rapid fire mode)
 
 void setup() {
@@ -215,7 +217,11 @@ void loop() {
        Serial.println("RUN OK");
     } else if (btMsg == "STP"){
        running = false;
+       binary = false;
        Serial.println("STP OK");
+    } else if (btMsg == "BIN"){
+       binary = true;
+       Serial.println("BIN OK");
     }
     btMsg = "";
   }
@@ -249,10 +255,42 @@ void bluetoothListen(){
 
 void sendUpdate(){
   if (running){
-    printGyro();
+    if (binary){
+      writeGyroFrame();
+    } else {
+      printGyro();
+    }
   }  
 }
 
+// binary position frame: sync byte 0xA5, type 0x01, sequence number,
+// x/y/z as little endian int16 in 1/100 degrees, checksum (sum of the
+// type, sequence and axis bytes)
+void putAxis(byte* frame, int offset, float p){
+  float c = p * 100.0f;
+  c = constrain(c, -32768.0f, 32767.0f);
+  int v = (int)c;
+  frame[offset]     = v & 0xFF;
+  frame[offset + 1] = (v >> 8) & 0xFF;
+}
+
+void writeGyroFrame(){
+  byte frame[10];
+  frame[0] = 0xA5;
+  frame[1] = 0x01;
+  frame[2] = frameSeq++;
+  putAxis(frame, 3, px);
+  putAxis(frame, 5, py);
+  putAxis(frame, 7, pz);
+  byte sum = 0;
+  for (int i=1; i<9; ++i){
+    sum += frame[i];
+  }
+  frame[9] = sum;
+  Serial.write(frame, 10);
+  Serial.flush();
+}
+
 void printGyro(){
   Serial.print("POS ");
   Serial.print(px);
@@ -1,7 +1,8 @@
 import alsaseq
 import threading
+import select
 import sync
-import time
+import clock
 import logging
 
 from command import *
@@ -10,27 +11,36 @@ class alsaInput (threading.Thread):
     def __init__(self):
         threading.Thread.__init__(self)
 
+    # translate one ALSA event into a command, None for ignored events
+    def command(self, event):
+        evtype = event[0]
+        if evtype == alsaseq.SND_SEQ_EVENT_NOTEON:
+            return (PSH_NOTE, event[7][1])
+        elif evtype == alsaseq.SND_SEQ_EVENT_NOTEOFF:
+            return (POP_NOTE, event[7][1])
+        elif evtype == alsaseq.SND_SEQ_EVENT_START:
+            return (TRP_START, None)
+        elif evtype == alsaseq.SND_SEQ_EVENT_STOP:
+            return (TRP_STOP, None)
+        elif evtype == alsaseq.SND_SEQ_EVENT_CLOCK:
+            return (TRP_TICK, None)
+        return None
+
     def run(self):
         print "starting alsa listener"
+        poller = select.poll()
+        poller.register(alsaseq.fd(), select.POLLIN)
+        poller.register(sync.wakeup, select.POLLIN)
         while not sync.terminate.isSet():
-            if alsaseq.inputpending():
+            try:
+                poller.poll()
+            except select.error:
+                continue # interrupted by a signal
+            # drain everything the sequencer has buffered
+            while alsaseq.inputpending():
                 event = alsaseq.input()
-                evtype = event[0]
-                pitch = event[7][1]
-                if evtype == alsaseq.SND_SEQ_EVENT_NOTEON:   
-                    cmd = (PSH_NOTE, pitch)
-                elif evtype == alsaseq.SND_SEQ_EVENT_NOTEOFF:
-                    cmd = (POP_NOTE, pitch)
-                elif evtype == alsaseq.SND_SEQ_EVENT_START:
-                    cmd = (TRP_START, None)
-                elif evtype == alsaseq.SND_SEQ_EVENT_STOP:
-                    cmd = (TRP_STOP, None)
-                elif evtype == alsaseq.SND_SEQ_EVENT_CLOCK:
-                    cmd = (TRP_TICK, None)
-                else:
-                    continue
-                sync.putCommand(cmd)
-            else:
-                time.sleep(0.005)
-                continue
+                stamp = clock.now()
+                cmd = self.command(event)
+                if cmd is not None:
+                    sync.putCommand(cmd, stamp)
         print "stopping alsa listener"
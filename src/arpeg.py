@@ -1,19 +1,72 @@
 import random
+import bisect
 
+# Held notes with a reference count per pitch, so duplicate note-ons
+# (several keyboards, sustain) need the same number of note-offs. The
+# sorted tuple of distinct pitches is only rebuilt when the set changes.
+class NoteSet:
+    def __init__(self):
+        self.counts = [0]*128  # note-ons per pitch
+        self.mask = 0          # bit i set if pitch i is held
+        self.pitches = []      # sorted distinct pitches
+        self.notes = ()        # cached sorted tuple
+
+    # returns True if the set of distinct pitches changed
+    def push(self, note):
+        if note < 0 or note > 127:
+            return False
+        count = self.counts[note]
+        self.counts[note] = count + 1
+        if count > 0:
+            return False
+        bisect.insort(self.pitches, note)
+        self.mask |= 1 << note
+        self.notes = tuple(self.pitches)
+        return True
+
+    def pop(self, note):
+        if note < 0 or note > 127:
+            return False
+        count = self.counts[note]
+        if count == 0:
+            return False
+        self.counts[note] = count - 1
+        if count > 1:
+            return False
+        del self.pitches[bisect.bisect_left(self.pitches, note)]
+        self.mask &= ~(1 << note)
+        self.notes = tuple(self.pitches)
+        return True
+
+    def __contains__(self, note):
+        return 0 <= note <= 127 and (self.mask >> note) & 1 == 1
+
+    def __len__(self):
+        return len(self.pitches)
+
+MAX_SHIFT = 8  # largest pattern shift applied by the note behavior
+
+# The held notes, play mode and pattern are compiled into a step sequence
+# of note positions, and per shift into a row of notes with positions
+# outside the chord extrapolated by octaves. Both are rebuilt lazily
+# after the chord or the mode changed, so a strike is a single index.
 class Arpeggiator:
-    def __init__(self, mode):
-        self.notes = []
+    def __init__(self, mode, seed=None):
+        self.random = random.Random(seed)  # seeded for replays
+        self.held = NoteSet()
+        self.notes = self.held.notes
         self.index = 0
+        self.mode = 'up'
         self.pattern = None
-        self.playUp = True
-        self.playDown = False
-        self.playRandom = False
+        self.invalidate()
         if mode == 'up':
             self.setUp()
         elif mode == 'down':
             self.setDown()
         elif mode == 'random':
             self.setRandom()
+        elif mode == 'triangle':
+            self.setTriangle()
         else:
             def makeidx(s):
                 try:
@@ -23,98 +76,102 @@ class Arpeggiator:
             self.setPattern(map(makeidx, mode.split(':')))
             
     def pushNote(self, note):
-        i = 0
-        insertion = False
-        for i, n in enumerate(self.notes):
-            if note < n:
-                self.notes.insert(i, note)
-                insertion = True
-                break
-        if not insertion:
-            self.notes.append(note)
+        if self.held.push(note):
+            self.notes = self.held.notes
+            self.invalidate()
 
     def popNote(self, note):
-        try:
-            self.notes.remove(note)
-        except ValueError:
-            empty = True # dummy foo
+        if self.held.pop(note):
+            self.notes = self.held.notes
+            self.invalidate()
 
-    def setUp(self):
-        self.playUp = True
-        self.playDown = False
-        self.playRandom = False
-        self.pattern = None
+    def invalidate(self):
+        self.sequence = None
+        self.rows = [None] * (2*MAX_SHIFT + 1)
+
+    def setMode(self, mode, pattern=None):
+        self.mode = mode
+        self.pattern = pattern
         self.index = 0
+        self.invalidate()
+
+    def setUp(self):
+        self.setMode('up')
         
     def setDown(self):
-        self.playUp = False
-        self.playDown = True
-        self.playRandom = False
-        self.pattern = None
-        self.index = len(self.notes) - 1
+        self.setMode('down')
         
     def setRandom(self):
-        self.playUp = False
-        self.playDown = False
-        self.playRandom = True
-        self.pattern = None
-        self.index = 0        
+        self.setMode('random')
+
+    def setTriangle(self):
+        self.setMode('triangle')
 
     def setPattern(self, pattern):
-        self.playUp = False
-        self.playDown = False
-        self.playRandom = False
-        self.pattern = pattern
-        self.index = 0
+        self.setMode('pattern', pattern)
+
+    # note positions played in one cycle
+    def compile(self):
+        n = len(self.notes)
+        if self.mode == 'down':
+            sequence = range(n-1, -1, -1)
+        elif self.mode == 'triangle':
+            sequence = range(n) + range(n-2, 0, -1)
+        elif self.mode == 'pattern':
+            sequence = self.pattern
+        else:
+            sequence = range(n)
+        self.sequence = tuple(sequence)
+        if self.sequence:
+            self.index = self.index % len(self.sequence)
 
     def extrapolate(self, index):
         n = len(self.notes)
-        o = 1 + (self.notes[-1] - self.notes[1]) / 12
+        o = 1 + (self.notes[-1] - self.notes[0]) / 12
         base = self.notes[index % n]
         note = base + 12 * o * (index / n)
         return min(127, max(0, note))
 
+    def noteAt(self, pos):
+        if pos >= 0 and pos < len(self.notes):
+            return self.notes[pos]
+        else:
+            return self.extrapolate(pos)
+
+    def row(self, shift):
+        row = tuple([self.noteAt(pos + shift) for pos in self.sequence])
+        self.rows[shift + MAX_SHIFT] = row
+        return row
+
     def getNote(self, shift=0):
         if len(self.notes) == 0:
             return None
-        if self.pattern is not None:
-            i = self.pattern[self.index]
-        else:
-            i = self.index
-        shifted = i + shift
-        if shifted >= 0 and shifted < len(self.notes):
-            return self.notes[shifted]
-        else:
-            return self.extrapolate(shifted)
+        if self.sequence is None:
+            self.compile()
+        if not self.sequence:
+            return None
+        if shift < -MAX_SHIFT or shift > MAX_SHIFT:
+            return self.noteAt(self.sequence[self.index] + shift)
+        row = self.rows[shift + MAX_SHIFT]
+        if row is None:
+            row = self.row(shift)
+        return row[self.index]
 
     def reset(self):
-        if self.playDown:
-            self.index = len(self.notes) - 1
-        else:
-            self.index = 0
+        self.index = 0
         
     def next(self):
         if len(self.notes) == 0:
             return None
-        if self.playUp:
-            self.index = (self.index + 1) % len(self.notes)
-            return self.notes[self.index]
-        elif self.playDown:
-            self.index = (self.index - 1) % len(self.notes)
-            return self.notes[self.index]
-        elif self.playRandom:
-            self.index = random.randint(0, len(self.notes)-1)
-            return self.notes[self.index]
+        if self.sequence is None:
+            self.compile()
+        if not self.sequence:
+            return None
+        if self.mode == 'random':
+            self.index = self.random.randint(0, len(self.sequence)-1)
         else:
-            if len(self.pattern) == 0:
-                return None
-            self.index = (self.index + 1) % len(self.pattern)
-            pos = self.pattern[self.index]
-            if pos >= len(self.notes):
-                pos = len(self.notes) - 1
-            elif pos < -len(self.notes):
-                pos = 0
-            return self.notes[pos]
+            self.index = (self.index + 1) % len(self.sequence)
+        return self.getNote()
 
 
 # arp = Arpeggiator()
@@ -0,0 +1,83 @@
+import threading
+import collections
+
+# box carried by queued continuous control updates
+class Box:
+    def __init__(self, value, stamp):
+        self.value = value
+        self.stamp = stamp
+        self.taken = False
+
+# Multi-producer, single-consumer command bus for (command, value)
+# tuples stamped with their arrival time. Producers append to a
+# deque (atomic under the GIL) and set a single wake-up event; the
+# consumer drains everything pending in one call. Nothing ever blocks a
+# producer. The capacity only bounds what the bus may lose when the
+# consumer stalls: on overflow, lossy commands (e.g. clock ticks) are
+# dropped and counted. All other commands change state and are queued
+# beyond the capacity; continuous controls still coalesce there, so they
+# add at most one entry per discrete command queued in between.
+#
+# Continuous controls keep only their latest unconsumed value: an update
+# overwrites the box of the pending entry for the same command until a
+# discrete command is queued behind it, so discrete commands keep their
+# order relative to control changes. Each continuous command is expected
+# to have a single producer thread.
+class CommandBus:
+    def __init__(self, continuous=[], lossy=[], capacity=1024):
+        self.items = collections.deque()
+        self.wakeup = threading.Event()
+        self.capacity = capacity
+        self.continuous = set(continuous)
+        self.lossy = set(lossy)
+        self.pending = {}     # open box per continuous command
+        self.coalesced = {}   # number of overwritten updates per command
+        self.dropped = 0      # number of commands lost on overflow
+
+    def put(self, cmd, stamp):
+        (c, value) = cmd
+        if c in self.continuous:
+            box = self.pending.get(c)
+            if box is not None and not box.taken:
+                box.value, box.stamp = value, stamp
+                if not box.taken:  # consumer did not grab the box meanwhile
+                    self.coalesced[c] = self.coalesced.get(c, 0) + 1
+                    return True
+            box = Box(value, stamp)
+            self.pending[c] = box
+            self.items.append((c, box, stamp))
+        else:
+            if len(self.items) >= self.capacity and c in self.lossy:
+                self.dropped += 1
+                self.wake()
+                return False
+            self.pending.clear()
+            self.items.append((c, value, stamp))
+        if not self.wakeup.isSet():
+            self.wakeup.set()
+        return True
+
+    def wake(self):
+        self.wakeup.set()
+
+    # all pending (command, value, stamp) tuples in order
+    def drain(self):
+        batch = []
+        items = self.items
+        continuous = self.continuous
+        while items:
+            (c, value, stamp) = items.popleft()
+            if c in continuous:
+                value.taken = True
+                (value, stamp) = (value.value, value.stamp)
+            batch.append((c, value, stamp))
+        return batch
+
+    # block until commands are available, then drain them
+    def wait(self):
+        self.wakeup.wait()
+        self.wakeup.clear()
+        return self.drain()
+
+    def __len__(self):
+        return len(self.items)
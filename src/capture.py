@@ -0,0 +1,86 @@
+import struct
+import threading
+
+# Session capture: every command entering sync.putCommand is appended to
+# a binary file with its monotonic stamp. The header holds the command
+# line of the session, so a replay can rebuild the same parameters.
+#
+# header:  magic, version, length of the command line, command line
+#          (arguments separated by NUL bytes)
+# record:  stamp (double), command, value kind, value
+MAGIC   = 'MCAP'
+VERSION = 1
+HEADER  = struct.Struct('<4sBH')
+RECORD  = struct.Struct('<dBB')
+
+# value kinds and their encodings
+NONE    = 0
+INT     = 1
+POS     = 2
+VALUES  = {INT : struct.Struct('<i'),
+           POS : struct.Struct('<ddd')}
+
+class CaptureError (Exception):
+    pass
+
+class Recorder:
+    def __init__(self, path, argv):
+        self.file = open(path, 'wb')
+        line = '\0'.join(argv)
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(line)) + line)
+        self.lock = threading.Lock()   # commands come from several threads
+        self.records = 0
+
+    def record(self, cmd, stamp):
+        (c, value) = cmd
+        if value is None:
+            data = RECORD.pack(stamp, c, NONE)
+        elif isinstance(value, tuple):
+            data = RECORD.pack(stamp, c, POS) + VALUES[POS].pack(*value)
+        else:
+            data = RECORD.pack(stamp, c, INT) + VALUES[INT].pack(value)
+        with self.lock:
+            if self.file is not None:
+                self.file.write(data)
+                self.records += 1
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+# read a capture, returns the command line and a list of (stamp, command)
+# tuples; a record cut off at the end (e.g. after a crash) is ignored
+def load(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise CaptureError("%s: not a capture file" % path)
+    (magic, version, n) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise CaptureError("%s: not a capture file" % path)
+    if version != VERSION:
+        raise CaptureError("%s: unsupported capture version %i" % (path, version))
+    offset = HEADER.size
+    line = data[offset:offset+n]
+    argv = line.split('\0') if line else []
+    offset += n
+    records = []
+    while offset + RECORD.size <= len(data):
+        (stamp, c, kind) = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if kind == NONE:
+            value = None
+        elif kind in VALUES:
+            fmt = VALUES[kind]
+            if offset + fmt.size > len(data):
+                break
+            value = fmt.unpack_from(data, offset)
+            offset += fmt.size
+            if kind == INT:
+                value = value[0]
+        else:
+            raise CaptureError("%s: corrupt record at offset %i" % (path, offset))
+        records.append((stamp, (c, value)))
+    return (argv, records)
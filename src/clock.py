@@ -0,0 +1,203 @@
+import time
+import threading
+import select
+import logging
+import ctypes
+import ctypes.util
+
+from util import WakePipe
+
+# monotonic time source (python 2 has no time.monotonic)
+CLOCK_MONOTONIC = 1
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+try:
+    _librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+    _clock_gettime = _librt.clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+    def now():
+        ts = _timespec()
+        _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+except (OSError, AttributeError):
+    logging.warning("no monotonic clock available, falling back to wall time")
+    now = time.time
+
+class Event:
+    def __init__(self, when, seq, action, args):
+        self.when = when       # deadline on the wheel's clock
+        self.seq = seq         # tie breaker for equal deadlines
+        self.action = action   # callable to invoke
+        self.args = args       # arguments for the callable
+        self.pos = -1          # index in the heap, -1 if not pending
+
+    def pending(self):
+        return self.pos >= 0
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+# Single dispatch thread for all deferred actions. Pending events live in
+# an indexed binary heap, so cancelling or moving an event is an in-place
+# O(log n) update. The thread sleeps in select() on a wake-up pipe, which
+# is written whenever the earliest deadline changes.
+class TimerWheel (threading.Thread):
+    def __init__(self, clock=now):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.now = clock
+        self.heap = []
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.waker = WakePipe()
+        self.stopped = False
+        self.due = None        # deadline of the event being run
+
+    # heap maintenance, callers hold self.lock
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        heap[i].pos = i
+        heap[j].pos = j
+
+    def _siftUp(self, i):
+        heap = self.heap
+        while i > 0:
+            parent = (i - 1) >> 1
+            if heap[i] < heap[parent]:
+                self._swap(i, parent)
+                i = parent
+            else:
+                break
+        return i
+
+    def _siftDown(self, i):
+        heap = self.heap
+        n = len(heap)
+        while True:
+            child = 2*i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child+1] < heap[child]:
+                child += 1
+            if heap[child] < heap[i]:
+                self._swap(i, child)
+                i = child
+            else:
+                break
+        return i
+
+    def _insert(self, event):
+        event.pos = len(self.heap)
+        self.heap.append(event)
+        return self._siftUp(event.pos)
+
+    def _remove(self, event):
+        i = event.pos
+        last = self.heap.pop()
+        event.pos = -1
+        if last is not event:
+            self.heap[i] = last
+            last.pos = i
+            self._siftDown(self._siftUp(i))
+
+    def _nextSeq(self):
+        self.seq += 1
+        return self.seq
+
+    def scheduleAt(self, when, action, *args):
+        with self.lock:
+            event = Event(when, self._nextSeq(), action, args)
+            top = self._insert(event) == 0
+        if top:
+            self.waker.wake()
+        return event
+
+    # unscheduled event, to be armed with reschedule()
+    def event(self, action, *args):
+        return Event(None, 0, action, args)
+
+    def schedule(self, delay, action, *args):
+        return self.scheduleAt(self.now() + delay, action, *args)
+
+    # returns False if the event was not pending (e.g. already fired)
+    def cancel(self, event):
+        with self.lock:
+            if event.pending():
+                self._remove(event)
+                return True
+        return False
+
+    # move a pending event (or re-arm a fired one) to a new deadline
+    def reschedule(self, event, when):
+        with self.lock:
+            event.when = when
+            event.seq = self._nextSeq()
+            if event.pending():
+                top = self._siftDown(self._siftUp(event.pos)) == 0
+            else:
+                top = self._insert(event) == 0
+        if top:
+            self.waker.wake()
+        return event
+
+    def stop(self):
+        self.stopped = True
+        self.waker.wake()
+
+    def run(self):
+        while not self.stopped:
+            self.lock.acquire()
+            event = None
+            timeout = None
+            if self.heap:
+                timeout = self.heap[0].when - self.now()
+                if timeout <= 0:
+                    event = self.heap[0]
+                    self._remove(event)
+            self.lock.release()
+            if event is not None:
+                self.due = event.when
+                try:
+                    event.action(*event.args)
+                except Exception:
+                    logging.exception("timer action failed")
+                continue
+            select.select([self.waker], [], [], timeout)
+            self.waker.clear()
+
+# clock for replays and offline rendering, moved forward explicitly
+class VirtualClock:
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def __call__(self):
+        return self.time
+
+# Timer wheel on a virtual clock without a thread of its own. advance()
+# runs all events due up to the given time in deadline order, setting the
+# clock to each deadline before running the action, so actions see the
+# time they were scheduled for.
+class VirtualWheel (TimerWheel):
+    def __init__(self, clock=None):
+        TimerWheel.__init__(self, clock or VirtualClock())
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.stopped = True
+
+    def advance(self, when):
+        while True:
+            with self.lock:
+                if not self.heap or self.heap[0].when > when:
+                    break
+                event = self.heap[0]
+                self._remove(event)
+            self.now.time = max(self.now.time, event.when)
+            self.due = event.when
+            event.action(*event.args)
+        self.now.time = max(self.now.time, when)
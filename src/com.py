@@ -64,6 +64,12 @@ def startCube(sock):
 def stopCube(sock):
     return handShake(sock, "STP\n", sync.stopOK, succMsg="[*] Stop OK")
 
+# switch position updates to binary frames, old firmware does not answer
+def requestBinary(sock):
+    return handShake(sock, "BIN\n", sync.binaryOK, 
+                     errorMsg="binary frames not supported, using text protocol",
+                     succMsg="[*] Binary OK")
+
 def requestStatus(sock):
     sock.send("GET\n")
     return True
@@ -6,15 +6,19 @@ POP_NOTE  = 7  # pop note from arpeggiator
 TRP_START = 8  # transport start
 TRP_STOP  = 9  # transport stop
 TRP_TICK  = 10 # MIDI clock tick
+SET_POS   = 11 # update X/Y/Z positions (degrees)
+
+names = {
+    TRG_ON  : 'TRG_ON',
+    TRG_OFF : 'TRG_OFF',
+    SET_POT : 'SET_POT',
+    PSH_NOTE : 'PSH_NOTE', 
+    POP_NOTE : 'POP_NOTE',
+    TRP_START : 'TRP_START',
+    TRP_STOP  : 'TRP_STOP',
+    TRP_TICK  : 'TRP_TICK',
+    SET_POS   : 'SET_POS'
+}
 
 def cmd2str(cmd):
-    return {
-        TRG_ON  : 'TRG_ON',
-        TRG_OFF : 'TRG_OFF',
-        SET_POT : 'SET_POS',
-        PSH_NOTE : 'PSH_NOTE', 
-        POP_NOTE : 'POP_NOTE',
-        TRP_START : 'TRP_START',
-        TRP_STOP  : 'TRP_STOP',
-        TRP_TICK  : 'TRP_TICK'
-    }.get(cmd, 'UNKNOWN COMMAND')
+    return names.get(cmd, 'UNKNOWN COMMAND')
@@ -0,0 +1,96 @@
+import re
+import collections
+
+from util import *
+
+# Cached event encoder: every distinct event tuple is built once by the
+# util builders and shared afterwards. Event tuples are immutable, so
+# handing out the same tuple to several batches is safe.
+noteOns   = {}
+noteOffs  = {}
+controls  = {}
+bends     = {}
+
+# ALSA event types built here
+NOTEON     = 6
+NOTEOFF    = 7
+CONTROLLER = 10
+PITCHBEND  = 13
+names = {NOTEON : 'NOTEON', NOTEOFF : 'NOTEOFF',
+         CONTROLLER : 'CONTROLLER', PITCHBEND : 'PITCHBEND'}
+
+def noteOn(pitch, velocity=127, chan=1):
+    key = (chan, pitch, velocity)
+    event = noteOns.get(key)
+    if event is None:
+        event = noteOns[key] = noteOnEvent(Note(pitch, velocity), chan=chan)
+    return event
+
+def noteOff(pitch, velocity=127, chan=1):
+    key = (chan, pitch, velocity)
+    event = noteOffs.get(key)
+    if event is None:
+        event = noteOffs[key] = noteOffEvent(Note(pitch, velocity), chan=chan)
+    return event
+
+# control event, invert value on negative control index
+def control(cc, val, chan=1):
+    key = (chan, cc, val)
+    event = controls.get(key)
+    if event is None:
+        event = controls[key] = ccEvent(cc, val, chan=chan)
+    return event
+
+# the same value on several controllers, e.g. the trigger CCs
+def controlGroup(ccs, val, chan=1):
+    key = (chan, tuple(ccs), val)
+    group = controls.get(key)
+    if group is None:
+        group = controls[key] = tuple([control(cc, val, chan) for cc in ccs])
+    return group
+
+def bend(pitch, chan=1):
+    key = (chan, pitch)
+    event = bends.get(key)
+    if event is None:
+        event = bends[key] = pitchBendEvent(pitch, chan=chan)
+    return event
+
+# Timestamped output on the sequencer queue of our client: the event is
+# delivered by ALSA delay seconds from now (relative real-time stamp).
+TIME_STAMP_REAL = 1
+TIME_MODE_REL   = 2
+
+def delayed(event, delay, queue):
+    if delay < 0:
+        delay = 0
+    sec = int(delay)
+    return ((event[0], TIME_STAMP_REAL | TIME_MODE_REL, event[2], queue,
+             (sec, int((delay - sec) * 1e9))) + event[5:])
+
+# Queue ids are global to the sequencer, and alsaseq does not tell which
+# one it allocated for our client. Look it up by owner in the queue list
+# of the kernel, None if it cannot be found.
+def findQueue(client, path='/proc/asound/seq/queues'):
+    if client is None:
+        return None
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except IOError:
+        return None
+    queue = None
+    for line in lines:
+        m = re.match(r"queue (\d+):", line)
+        if m:
+            queue = int(m.group(1))
+            continue
+        m = re.match(r"owned by client\s*:\s*(-?\d+)", line)
+        if m and queue is not None and int(m.group(1)) == client:
+            return queue
+    return None
+
+# Events of one scheduler step. Each step builds its own batch on the
+# thread running it and hands it to the output as a whole.
+class Batch (list):
+    add = list.append
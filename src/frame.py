@@ -0,0 +1,126 @@
+import struct
+
+# Decoders for the byte stream received from the MIDI cube. Received data
+# is written straight into a reusable bytearray; all complete messages in
+# it are split off in one pass and the incomplete tail is moved to the
+# front of the buffer.
+
+# Binary frames (negotiated with 'BIN'): sync byte, frame type, sequence
+# number, three int16 axes in 1/100 degrees (little endian) and the sum
+# of the type, sequence and axis bytes modulo 256.
+SYNC       = 0xA5
+FRAME_POS  = 0x01
+FRAME      = struct.Struct('<BBBhhhB')
+FRAME_SIZE = FRAME.size
+POS_SCALE  = 0.01
+
+def checksum(buf, offset=0):
+    return sum(buf[offset+1:offset+FRAME_SIZE-1]) & 0xFF
+
+def encodePos(seq, x, y, z):
+    def axis(a):
+        return max(-32768, min(32767, int(round(a / POS_SCALE))))
+    frame = bytearray(FRAME.pack(SYNC, FRAME_POS, seq & 0xFF, axis(x), axis(y), axis(z), 0))
+    frame[-1] = checksum(frame)
+    return frame
+
+class LineDecoder:
+    def __init__(self, size=4096):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.fill = 0           # number of valid bytes in buffer
+        self.overruns = 0       # lines dropped for exceeding the buffer
+        self.skipping = False   # discarding the rest of an overlong line
+
+    # free part of the buffer, to be filled by recv_into
+    def space(self):
+        return self.view[self.fill:]
+
+    # copy received data into the buffer, returns the number of bytes taken
+    def put(self, data):
+        n = min(len(data), len(self.buffer) - self.fill)
+        self.buffer[self.fill:self.fill+n] = data[:n]
+        return n
+
+    # account n new bytes and append all complete messages to out
+    def feed(self, n, out):
+        self.fill += n
+        start = self.split(out)
+        rest = self.fill - start
+        if start > 0 and rest > 0:
+            self.buffer[0:rest] = self.buffer[start:self.fill]
+        self.fill = rest
+        if self.fill == len(self.buffer):
+            self.overruns += 1
+            self.skipping = True
+            self.fill = 0
+
+    # append complete lines to out, returns the offset of the tail
+    def split(self, out):
+        buf = self.buffer
+        start = 0
+        while True:
+            pos = buf.find('\n', start, self.fill)
+            if pos < 0:
+                return start
+            line = str(buf[start:pos]).strip()
+            if self.skipping:
+                self.skipping = False
+            elif line:
+                out.append(line)
+            start = pos + 1
+
+# Decoder for text lines mixed with binary frames. Text never contains the
+# sync byte, so a message starting with it is a frame. Frames are appended
+# to the output as (type, payload) tuples, lines as strings.
+class FrameDecoder (LineDecoder):
+    def __init__(self, size=4096):
+        LineDecoder.__init__(self, size)
+        self.seq = None         # sequence number of the last frame
+        self.lost = 0           # frames missing according to sequence numbers
+        self.errors = 0         # bytes skipped to resynchronise
+
+    def split(self, out):
+        buf = self.buffer
+        fill = self.fill
+        start = 0
+        while start < fill:
+            if buf[start] == SYNC:
+                if fill - start < FRAME_SIZE:
+                    return start
+                (sync, kind, seq, x, y, z, check) = FRAME.unpack_from(buf, start)
+                if kind != FRAME_POS or check != checksum(buf, start):
+                    # skip the broken frame, or up to a sync byte inside it
+                    end = buf.find(chr(SYNC), start + 1, start + FRAME_SIZE)
+                    if end < 0:
+                        end = start + FRAME_SIZE
+                    self.errors += end - start
+                    start = end
+                    continue
+                if self.seq is not None:
+                    self.lost += (seq - self.seq - 1) & 0xFF
+                self.seq = seq
+                out.append((kind, (x * POS_SCALE, y * POS_SCALE, z * POS_SCALE)))
+                start += FRAME_SIZE
+                continue
+            pos = buf.find('\n', start, fill)
+            if pos < 0:
+                # a frame may follow an incomplete (corrupted) line
+                sync = buf.find(chr(SYNC), start, fill)
+                if sync < 0:
+                    return start
+                self.errors += sync - start
+                start = sync
+                continue
+            sync = buf.find(chr(SYNC), start, pos)
+            if sync >= 0:
+                self.errors += sync - start
+                start = sync
+                continue
+            line = str(buf[start:pos]).strip()
+            if self.skipping:
+                self.skipping = False
+            elif line:
+                out.append(line)
+            start = pos + 1
+        return start
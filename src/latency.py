@@ -0,0 +1,62 @@
+import command
+
+# Latency histogram with fixed linear buckets. Recording is a single list
+# increment, percentiles are computed only when reporting. Latencies
+# beyond the last bucket are counted in it, the maximum is kept exactly.
+class Histogram:
+    def __init__(self, resolution=1e-5, limit=0.1):
+        self.resolution = resolution
+        self.counts = [0] * (int(limit / resolution) + 1)
+        self.last = len(self.counts) - 1
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, latency):
+        i = int(latency / self.resolution)
+        if i > self.last:
+            i = self.last
+        elif i < 0:
+            i = 0
+        self.counts[i] += 1
+        self.count += 1
+        if latency > self.max:
+            self.max = latency
+
+    # upper bound of the bucket holding fraction p of all recordings
+    def percentile(self, p):
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min((i + 1) * self.resolution, self.max)
+        return self.max
+
+# Input-to-output latency per command type: the time from the arrival of
+# a command (its bus stamp) until the output writer has handed the events
+# of its step to the sequencer.
+class LatencyTracer:
+    PERCENTILES = [0.5, 0.95, 0.99]
+
+    def __init__(self, resolution=1e-5, limit=0.1):
+        self.resolution = resolution
+        self.limit = limit
+        self.histograms = {}
+
+    def record(self, cmd, stamp, now):
+        h = self.histograms.get(cmd)
+        if h is None:
+            h = self.histograms[cmd] = Histogram(self.resolution, self.limit)
+        h.record(now - stamp)
+
+    def report(self):
+        lines = ["latency (ms)        count     p50     p95     p99     max"]
+        for cmd, h in sorted(self.histograms.items()):
+            if not h.count:
+                continue
+            values = [h.percentile(p) for p in self.PERCENTILES] + [h.max]
+            lines.append("%-16s %8i" % (command.cmd2str(cmd), h.count)
+                         + "".join([" %7.2f" % (1000 * v) for v in values]))
+        if len(lines) == 1:
+            lines.append("no output recorded")
+        return "\n".join(lines)
@@ -0,0 +1,118 @@
+import alsaseq
+import logging
+import events
+import metrics
+
+from numpy import interp, sin, array, arange, zeros, ones, nonzero
+from math import pi
+
+from util import *
+
+class LFO:
+    def __init__(self, cc, wav):
+        self.wav = wav         # Waveform
+        self.cc = cc           # index of MIDI controller to write
+        self.amplitude = 1.0   # initial LFO amplitude
+        self.resolution = 256  # samples per period
+        self.initSamples(wav)
+
+    def initSamples(self, wav):
+        self.samples = []
+        if wav in ['sin', 'wah']:
+            step = 2*pi / self.resolution
+            def makeSample(x):
+                return int(interp(sin(x*step), [-1,1], [0,127]))
+            self.samples = map(makeSample, range(0, self.resolution))
+            if wav == 'wah':
+                self.amplitude = 0.0
+        elif wav == 'tri':
+            xkeys = [0, 0.25*self.resolution, 0.75*self.resolution, self.resolution]
+            ykeys = [64, 127, 0, 64]
+            def makeSample(x):
+                return int(interp(x, xkeys, ykeys))
+            self.samples = map(makeSample, range(0, self.resolution))
+        elif wav == 'saw':
+            def makeSample(x):
+                return (64 + int(interp(x, [0, self.resolution], [0, 127]))) % 128
+            self.samples = map(makeSample, range(0, self.resolution))
+        elif wav == 'sqr':
+            def makeSample(x):
+                if x < 0.5*self.resolution:
+                    return 127
+                else:
+                    return 0
+            self.samples = map(makeSample, range(0, self.resolution))
+        else:
+            self.samples = [0]*self.resolution
+
+# Ticks the whole LFO bank from one periodic event on the timer wheel.
+# Deadlines advance by whole periods from the start time, so timer
+# latency does not accumulate; if a tick is late by more than a period,
+# the missed samples are skipped and counted as overruns.
+class LFOEngine:
+    def __init__(self, lfos, params, wheel, output=None):
+        self.params = params
+        self.wheel = wheel
+        self.output = output or self.write
+        self.rate = params.lfoRate             # control rate in Hz
+        self.period = 1.0 / self.rate          # control period
+        self.resolution = 256                  # samples per LFO period
+        self.ccs = [lfo.cc for lfo in lfos]
+        n = len(lfos)
+        self.samples = array([lfo.samples for lfo in lfos]).reshape(n, self.resolution)
+        self.rows = arange(n)
+        self.wah = array([lfo.wav == 'wah' for lfo in lfos], dtype=bool)
+        self.amplitude = array([lfo.amplitude for lfo in lfos], dtype=float)
+        self.freq = ones(n)                    # LFO frequencies in Hz
+        self.tick = zeros(n)                   # phases in samples
+        self.values = zeros(n, dtype=int)      # current values of MIDI cc
+        self.deadline = None
+        self.event = None
+        self.overruns = 0
+        metrics.registry.gauge('lfo.overruns', lambda: self.overruns)
+
+    def setFrequency(self, f):
+        self.freq[:] = f
+
+    def setWahAmplitude(self, a):
+        self.amplitude[self.wah] = a
+
+    def sample(self):
+        if self.event is None:
+            return
+        due = self.deadline
+        steps = 1
+        late = self.wheel.now() - self.deadline
+        if late >= self.period:
+            missed = int(late / self.period)
+            self.overruns += missed
+            steps += missed
+        self.deadline += steps * self.period
+        self.wheel.reschedule(self.event, self.deadline)
+        self.tick = (self.tick + steps * self.period * self.resolution * self.freq) % self.resolution
+        raw = self.samples[self.rows, self.tick.astype(int)]
+        values = 64 + (self.amplitude * (raw - 64)).astype(int)
+        changed = nonzero(values != self.values)[0]
+        self.values = values
+        chan = self.params.midiChan
+        ccs = self.ccs
+        self.output([events.control(ccs[i], int(values[i]), chan=chan) for i in changed], due)
+
+    # without an output writer, the events go straight to the sequencer
+    def write(self, out, due=None):
+        for event in out:
+            alsaseq.output(event)
+
+    def start(self):
+        if len(self.ccs) == 0:
+            return
+        self.deadline = self.wheel.now()
+        self.event = self.wheel.event(self.sample)
+        self.wheel.reschedule(self.event, self.deadline)
+
+    def stop(self):
+        if self.event:
+            self.wheel.cancel(self.event)
+            self.event = None
+        if self.overruns:
+            logging.info("LFO engine skipped %i samples" % self.overruns)
@@ -1,47 +1,168 @@
 import bluetooth
 import signal
 import time
-import re
 import threading
 import select
 import logging
-
-from threading import Timer
+import errno
+import collections
+import socket
+import math
 
 import sync
 import command
 import com
+import clock
+import metrics
 
+from frame import LineDecoder, FrameDecoder, FRAME_POS
 from util import *
 
+# Heartbeat watchdog as a deadline checked by the reader loop. The timeout
+# adapts to the observed heartbeat intervals (smoothed mean plus four
+# times the smoothed deviation, like a TCP retransmission timer) within
+# [minTimeout, maxTimeout], and stays at maxTimeout until enough
+# intervals have been seen. On a steady link the deviation shrinks to
+# almost nothing, so the timeout never goes below the given number of
+# missed intervals: a single late Bluetooth burst is not a dead link.
+class Watchdog:
+    def __init__(self, minTimeout=0.1, maxTimeout=0.5, warmup=8, missed=2):
+        self.minTimeout = minTimeout
+        self.maxTimeout = maxTimeout
+        self.warmup = warmup
+        self.missed = missed    # heartbeats that may be missing
+        self.deadline = None    # None until the first heartbeat
+        self.last = None        # time of the last heartbeat
+        self.mean = 0.0         # smoothed interval
+        self.dev = 0.0          # smoothed interval deviation
+        self.timeout = maxTimeout
+        # interval statistics for the shutdown report
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.shortest = None
+        self.longest = None
+
+    def beat(self, now):
+        if self.last is not None:
+            self.record(now - self.last)
+        self.last = now
+        self.deadline = now + self.timeout
+
+    def record(self, interval):
+        if self.count == 0:
+            self.mean = interval
+            self.dev = interval / 2
+        else:
+            self.dev += (abs(interval - self.mean) - self.dev) / 4
+            self.mean += (interval - self.mean) / 8
+        self.count += 1
+        self.total += interval
+        self.squares += interval * interval
+        self.shortest = min(interval, self.shortest or interval)
+        self.longest = max(interval, self.longest or interval)
+        if self.count >= self.warmup:
+            timeout = max((self.missed + 1) * self.mean, self.mean + 4 * self.dev)
+            self.timeout = max(self.minTimeout, min(self.maxTimeout, timeout))
+
+    # seconds until the deadline, None if not armed
+    def remaining(self, now):
+        if self.deadline is None:
+            return None
+        return self.deadline - now
+
+    def state(self, now):
+        remaining = self.remaining(now)
+        if remaining is None:
+            return "waiting for first heartbeat"
+        return ("timeout %.1f ms, %.1f ms left, %i intervals"
+                % (1000*self.timeout, 1000*remaining, self.count))
+
+    def report(self):
+        if self.count == 0:
+            return "no heartbeat intervals"
+        mean = self.total / self.count
+        std = math.sqrt(max(0.0, self.squares / self.count - mean * mean))
+        return ("heartbeat: %i intervals, mean %.1f ms, std %.1f ms, "
+                "min %.1f ms, max %.1f ms, timeout %.1f ms"
+                % (self.count, 1000*mean, 1000*std, 1000*self.shortest,
+                   1000*self.longest, 1000*self.timeout))
+
 class Listener (threading.Thread):
-    def __init__(self, sock, address):
+    def __init__(self, sock, address, binary=False):
         threading.Thread.__init__(self)
         self.sock  = sock
         self.address = address
         self.ready = select.select([sock], [], [], 1)
-        self.pendingMsg = ''
-        self.watchdog = None
+        if binary:
+            self.decoder = FrameDecoder()
+        else:
+            self.decoder = LineDecoder()
+        self.messages = collections.deque()
+        self.recvInto = hasattr(sock, 'recv_into')
+        self.poller = select.poll()
+        self.poller.register(sock, select.POLLIN)
+        self.poller.register(sync.wakeup, select.POLLIN)
+        self.watchdog = Watchdog()
         self.alive = True
+        self.illegal = 0        # number of unknown or malformed messages
+        self.arrival = None     # receive time of the pending messages
+        self.received = metrics.registry.counter('bt.bytes')
+        metrics.registry.gauge('bt.illegal', lambda: self.illegal)
+        metrics.registry.gauge('bt.overruns', lambda: self.decoder.overruns)
+        metrics.registry.gauge('watchdog', lambda: self.watchdog.state(clock.now()))
+
+    # read available data from the socket into the decoder,
+    # returns False if the connection is gone
+    def receive(self):
+        decoder = self.decoder
+        try:
+            if self.recvInto:
+                n = self.sock.recv_into(decoder.space())
+            else:
+                data = self.sock.recv(len(decoder.space()))
+                n = decoder.put(data)
+        except (bluetooth.BluetoothError, socket.error) as e:
+            # pybluez reports EAGAIN in the message only
+            if getattr(e, 'errno', None) in [errno.EAGAIN, errno.EWOULDBLOCK] \
+               or 'temporarily unavailable' in str(e):
+                return True
+            logging.error("bluetooth receive failed: %s" % str(e))
+            return False
+        if n == 0:
+            return False
+        self.arrival = clock.now()
+        self.received.inc(n)
+        decoder.feed(n, self.messages)
+        return True
 
+    # next message from the cube, None on termination or disconnect
     def readSock(self):
-        resp = self.pendingMsg
         while self.alive and not sync.terminate.isSet():
-            pos = resp.find('\n')
-            if pos > 0:
-                if pos == len(resp) - 1:
-                    self.pendingMsg = ''
-                    return resp.strip()
-                else:
-                    prefix = resp[0:pos]
-                    self.pendingMsg = resp[pos+1:]
-                    return prefix.strip()
+            if self.messages:
+                return self.messages.popleft()
+            remaining = self.watchdog.remaining(clock.now())
+            expired = remaining is not None and remaining <= 0
+            if remaining is None:
+                timeout = None
+            elif expired:
+                # the thread may have been busy past the deadline with a
+                # heartbeat already buffered: read what is there first
+                timeout = 0
+            else:
+                timeout = 1000 * remaining
             try:
-                data = self.sock.recv(1024)
-            except:
-                time.sleep(0.001)
-                continue
-            resp += data
+                ready = self.poller.poll(timeout)
+            except select.error:
+                continue # interrupted by a signal
+            for (fd, event) in ready:
+                if fd != sync.wakeup.fileno() and not self.receive():
+                    self.die()
+                    return None
+            if expired and not self.messages:
+                logging.error("heartbeat missing for %.1f ms" % (1000*self.watchdog.timeout))
+                self.die()
+                return None
         return None
 
     def die(self):
@@ -52,10 +173,7 @@ class Listener (threading.Thread):
         print "I'm dead :-("
 
     def live(self):
-        if self.watchdog:
-            self.watchdog.cancel()
-        self.watchdog = Timer(0.5, self.die)
-        self.watchdog.start()
+        self.watchdog.beat(clock.now())
 
     # def resurrect(self):
     #     while not sync.terminate.isSet():
@@ -71,46 +189,72 @@ class Listener (threading.Thread):
         time.sleep(0.5)
         return 'RUN OK'
 
-    # def putCommand(self, cmd):
-    #     sync.qLock.acquire()
-    #     sync.queue.put(cmd)
-    #     logging.debug("send command %s" % command.cmd2str(cmd))
-    #     sync.qLock.release()
-    #     sync.queueEvent.set()
+    # message handlers, keyed by the first token of a message. Each
+    # handler gets the rest of the message and returns False if it
+    # cannot make sense of it.
+    def onPot(self, arg):
+        try:
+            pot = int(arg)
+        except ValueError:
+            return False
+        sync.putCommand((command.SET_POT, pot), self.arrival)
+        return True
+
+    def onPos(self, arg):
+        try:
+            pos = tuple(map(float, arg.split(',')))
+        except ValueError:
+            return False
+        if len(pos) != 3:
+            return False
+        sync.putCommand((command.SET_POS, pos), self.arrival)
+        return True
+
+    def onTrigger(self, arg):
+        if arg == 'ON':
+            sync.putCommand((command.TRG_ON, None), self.arrival)
+        elif arg == 'OFF':
+            sync.putCommand((command.TRG_OFF, None), self.arrival)
+        else:
+            return False
+        return True
+
+    def onAlive(self, arg):
+        self.live()
+        return True
+
+    def confirm(self, event):
+        def handler(arg):
+            if arg != 'OK':
+                return False
+            event.set()
+            return True
+        return handler
 
     def run(self):
         print "starting bluetooth listener"
+        handlers = {'POS'   : self.onPos,
+                    'POT'   : self.onPot,
+                    'TRG'   : self.onTrigger,
+                    'ALIVE' : self.onAlive,
+                    'RUN'   : self.confirm(sync.runOK),
+                    'STP'   : self.confirm(sync.stopOK),
+                    'RST'   : self.confirm(sync.resetOK),
+                    'BIN'   : self.confirm(sync.binaryOK)}
         while self.alive and not sync.terminate.isSet():
             msg = self.readSock()
             if msg is None:
                 continue
-            logging.debug("bluetooth message: %s" % msg)
-            if msg == 'ALIVE':
-                self.live()
-                continue
-            if msg == 'RUN OK':
-                sync.runOK.set()
-                continue
-            if msg == 'STP OK':
-                sync.stopOK.set()
+            if msg.__class__ is tuple:  # binary frame
+                (kind, payload) = msg
+                if kind == FRAME_POS:
+                    sync.putCommand((command.SET_POS, payload), self.arrival)
                 continue
-            if msg == 'RST OK':
-                sync.resetOK.set()
-                continue
-            if msg == 'TRG ON':
-                cmd = (command.TRG_ON, None)
-                sync.putCommand(cmd)
-                continue
-            if msg == 'TRG OFF':
-                cmd = (command.TRG_OFF, None)
-                sync.putCommand(cmd)
-                continue            
-            m = re.search('POT (\d+)', msg)
-            if m:
-                pot = int(m.group(1)); 
-                cmd = (command.SET_POT, pot)
-                sync.putCommand(cmd)
-                continue
-            logging.warning("illegal message  '%s'" % msg)
+            (verb, sep, arg) = msg.partition(' ')
+            handler = handlers.get(verb)
+            if handler is None or not handler(arg):
+                self.illegal += 1
         print "stopping bluetooth listener"
-
+        print self.watchdog.report()
+        if self.illegal:
+            logging.warning("received %i illegal messages" % self.illegal)
@@ -0,0 +1,152 @@
+import logging
+import threading
+import collections
+import time
+
+LEVELS = {'debug'   : logging.DEBUG,
+          'info'    : logging.INFO,
+          'warning' : logging.WARNING,
+          'error'   : logging.ERROR,
+          'off'     : logging.CRITICAL + 1}
+
+# Logging handler that only queues the unformatted record in the calling
+# thread. A background writer formats the records and passes them on to
+# the target handler, so the MIDI threads never format or touch the file.
+# Besides log records, the queue takes compact (time, level, msg, args)
+# tuples from debug() below, which skip building a LogRecord entirely.
+# For a stream target the writer formats a whole batch and writes it
+# with a single write and flush, where a synchronous handler takes its
+# lock, writes and flushes once per record; that makes the total cost
+# per record lower than logging synchronously (see bench/logcost.py).
+class AsyncHandler (logging.Handler):
+    def __init__(self, target, interval=0.01):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.interval = interval
+        self.batched = isinstance(target, logging.StreamHandler)
+        self.records = collections.deque()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.writer = threading.Thread(target=self.write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    # called by the logger instead of emit, avoids the handler lock
+    def handle(self, record):
+        self.push(record)
+        return True
+
+    def emit(self, record):
+        self.push(record)
+
+    def push(self, entry):
+        self.records.append(entry)
+        if not self.wakeup.isSet():
+            self.wakeup.set()
+
+    def expand(self, entry):
+        (created, level, msg, args) = entry
+        record = logging.LogRecord('root', level, '', 0, msg, args, None)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        return record
+
+    # write all queued records, then release the flush() calls waiting
+    # for them; only ever called by one thread at a time
+    def drain(self):
+        lines = []
+        waiting = []
+        pop = self.records.popleft
+        try:
+            while True:
+                record = pop()
+                if record.__class__ is tuple:
+                    record = self.expand(record)
+                elif record.__class__ is Flush:
+                    waiting.append(record)
+                    continue
+                if not self.batched:
+                    self.target.handle(record)
+                    continue
+                try:
+                    lines.append(self.target.format(record))
+                    last = record
+                except Exception:
+                    self.target.handleError(record)
+        except IndexError:
+            pass
+        if lines:
+            stream = self.target.stream
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except (IOError, UnicodeError):
+                self.target.handleError(last)
+        for flush in waiting:
+            flush.done.set()
+
+    # Drain at most once per interval: records gather in the meantime, so
+    # the batches grow and producers find the wake-up event already set
+    # instead of signalling the writer for every record.
+    def write(self):
+        while not self.stopped:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.drain()
+            time.sleep(self.interval)
+
+    # wait until the writer has written everything queued so far
+    def flush(self):
+        if self.writer.isAlive():
+            flush = Flush()
+            self.push(flush)
+            flush.done.wait(1)
+        self.target.flush()
+
+    # stop the writer, which drains the queue once more before it exits;
+    # only what was queued after that is written from here
+    def close(self):
+        if not self.stopped:
+            self.stopped = True
+            self.wakeup.set()
+            self.writer.join(1)
+            if not self.writer.isAlive():
+                self.drain()
+            self.target.close()
+        logging.Handler.close(self)
+
+# marker queued by AsyncHandler.flush, set by the writer once reached
+class Flush:
+    def __init__(self):
+        self.done = threading.Event()
+
+handler = None     # asynchronous handler installed by setup()
+debugging = False  # debug() is enabled
+
+# Debug log for the MIDI threads: queues a compact tuple for the
+# asynchronous writer, a no-op unless logging at debug level.
+def debug(msg, *args):
+    if debugging:
+        handler.push((time.time(), logging.DEBUG, msg, args))
+
+# Make log records cheaper to create: skip the stack walk for caller
+# information and process bookkeeping, neither is used by our format.
+def compactRecords():
+    logging._srcfile = None
+    logging.logProcesses = 0
+    logging.logMultiprocessing = 0
+
+# log to a file through an asynchronous writer, level is one of LEVELS
+def setup(filename='debug.log', level='debug'):
+    global handler, debugging
+    compactRecords()
+    root = logging.getLogger()
+    root.setLevel(LEVELS[level])
+    if level == 'off':
+        root.addHandler(logging.NullHandler())
+        return
+    target = logging.FileHandler(filename)
+    target.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    handler = AsyncHandler(target)
+    root.addHandler(handler)
+    debugging = LEVELS[level] <= logging.DEBUG
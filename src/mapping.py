@@ -0,0 +1,58 @@
+from numpy import interp, arange, power
+
+from util import *
+
+POT_MAX = 1023
+POS_RANGE = 90.0   # degrees from center to either end of the pot range
+QUANT_MODS = [48, 36, 32, 24, 18, 16, 12, 8, 6, 4, 3, 2]
+
+# pot position of an axis angle in degrees
+def angleToPot(angle):
+    pot = int((angle + POS_RANGE) * (POT_MAX / (2*POS_RANGE)))
+    return min(POT_MAX, max(0, pot))
+
+# Precomputed pot-to-value tables, indexed by the (gamma corrected) pot
+# position 0..1023. The tables are plain lists, so a pot update only costs
+# a few list indexings. update() rebuilds only the tables whose parameters
+# changed since the last call.
+class PotMap:
+    def __init__(self, params):
+        self.keys = {}
+        pots = arange(POT_MAX + 1)
+        def table(xp, fp, conv=int):
+            return map(conv, interp(pots, xp, fp))
+        self.cc = table([0, POT_MAX], [0, 127])
+        self.freq = table([0, POT_MAX], [0.1, 8], float)
+        self.amp = table([0, POT_MAX], [0.0, 1.0], float)
+        self.bpm = table([0, 512, POT_MAX], [30, 120, 480])
+        self.shift = table([0, POT_MAX], [-8, 8])
+        self.tickMod = [QUANT_MODS[i] for i in table([0, 512, POT_MAX], [0, 6, 11])]
+        # bend is indexed by the pot offset wrt. the trigger position + 1023
+        offsets = arange(-POT_MAX, POT_MAX + 1)
+        self.bend = map(int, interp(offsets, [-POT_MAX, POT_MAX], [0, 16383]))
+        self.update(params)
+
+    def changed(self, name, key):
+        if name in self.keys and self.keys[name] == key:
+            return False
+        self.keys[name] = key
+        return True
+
+    def update(self, params):
+        if self.changed('curve', params.gamma):
+            pots = arange(POT_MAX + 1)
+            if not params.gamma:
+                self.curve = range(POT_MAX + 1)
+            else:
+                self.curve = map(int, power(pots / float(POT_MAX), params.gamma) * POT_MAX)
+        if self.changed('note', (params.scale, params.rang, params.octaves)):
+            self.note = self.noteTable(params)
+
+    def noteTable(self, params):
+        pots = arange(POT_MAX + 1)
+        if params.rang:
+            return map(int, interp(pots, [0, POT_MAX], [params.rang[0], params.rang[1]]))
+        scale = scaleTable(params.scale)
+        noteRange = scale.degrees * params.octaves
+        indices = map(int, interp(pots, [0, POT_MAX], [-noteRange, noteRange]))
+        return [scale.note(i) for i in indices]
@@ -0,0 +1,124 @@
+import os
+import threading
+import logging
+import clock
+
+# Runtime metrics shared by all threads. Counters are plain attribute
+# increments by their single producer thread, tallies keep a dict per
+# producer thread; both are cheap enough to stay enabled. Gauges are
+# functions sampled only when a snapshot is taken. Snapshots
+# are plain text, one metric per line, counters with their total and
+# their rate since the previous snapshot.
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+# Counters keyed by a type, like command or MIDI event types, which
+# several threads update. Every thread counts into a dict of its own, so
+# no increment is lost to a concurrent read-modify-write; the dicts are
+# summed when read.
+class Tally:
+    def __init__(self, names={}):
+        self.names = names
+        self.local = threading.local()
+        self.shards = []        # the dicts of all producer threads
+
+    def inc(self, key, n=1):
+        try:
+            counts = self.local.counts
+        except AttributeError:
+            counts = self.local.counts = {}
+            self.shards.append(counts)
+        counts[key] = counts.get(key, 0) + n
+
+    def totals(self):
+        totals = {}
+        for counts in list(self.shards):
+            for key, n in counts.items():
+                totals[key] = totals.get(key, 0) + n
+        return totals
+
+    def items(self):
+        return [(str(self.names.get(key, key)), n) for key, n in self.totals().items()]
+
+class Registry:
+    def __init__(self):
+        self.counters = {}
+        self.tallies = {}
+        self.gauges = {}
+        self.previous = {}      # counter values of the last snapshot
+        self.last = None        # time of the last snapshot
+        self.started = clock.now()
+
+    def counter(self, name):
+        c = self.counters.get(name)
+        if c is None:
+            c = self.counters[name] = Counter()
+        return c
+
+    def tally(self, name, names={}):
+        t = self.tallies.get(name)
+        if t is None:
+            t = self.tallies[name] = Tally(names)
+        return t
+
+    # register a function returning the current value, replaces older ones
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def values(self):
+        values = [(name, c.value) for name, c in self.counters.items()]
+        for name, t in self.tallies.items():
+            values.extend([(name + '.' + key, n) for key, n in t.items()])
+        return values
+
+    def snapshot(self):
+        now = clock.now()
+        lines = ["uptime %.1f" % (now - self.started)]
+        for name, fn in sorted(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                value = 'error: %s' % e
+            lines.append("%s %s" % (name, value))
+        elapsed = now - (self.last or self.started)
+        values = sorted(self.values())
+        for name, value in values:
+            rate = (value - self.previous.get(name, 0)) / max(elapsed, 1e-3)
+            lines.append("%s %i %.1f/s" % (name, value, rate))
+        self.previous = dict(values)
+        self.last = now
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# Periodically replaces a text file with a snapshot of the registry. The
+# snapshot is written to a temporary file first and renamed, so readers
+# never see a partial file.
+class Reporter (threading.Thread):
+    def __init__(self, path, interval=1.0, stop=None, registry=registry):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.stopped = stop or threading.Event()
+
+    def write(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(self.registry.snapshot())
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as e:
+            logging.warning("could not write metrics: %s" % str(e))
+
+    def run(self):
+        while not self.stopped.isSet():
+            self.write()
+            self.stopped.wait(self.interval)
+        self.write()
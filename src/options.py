@@ -0,0 +1,268 @@
+import re
+import getopt
+
+import util
+import log
+
+from params import *
+
+# command line options of midicube.py
+
+def usage():
+    print """gyro.py [options]
+Global options:
+-m --mac              bluetooth device address of MIDI cube
+   --binary           request binary position frames (falls back to text
+                      with old firmware)
+   --midiout <id:p>   connect to midi client id on input port p
+-c --chan <i>         MIDI output channel (default: 1)
+
+Behavior control:
+-b <beh> --behavior add behavior to poti, where <beh> can be any of the following: 
+    
+note         select pitch of played note
+bend         pitch bend control
+vel          velocity of played note
+speed        set speed for arpeggiator
+cc<i>        MIDI controller #i 
+lfo<i>       Low frequency oscillator (sine wave) on MIDI controller #i
+lfo<i>:<wav> Low frequency oscillator with specified wave form, where <wav> can
+             be sin (sine wave), tri (triangle), saw (sawtooth), sqr (square).
+wah<i>       Auto Wah on Midi controller #i. This corresponds to a sine wave LFO
+             centered on value 64, controlling both frequency and amplitude.
+
+-x -y -z <beh>      add behavior to the X, Y or Z axis of the cube's position
+                    frames (+/-90 degrees span the poti range). The poti is
+                    the X axis, so -b is the same as -x.
+
+Further options that control the behavior:
+-s --scale 'D#' restricts played notes to the D# major scale. Legal scales are
+                minor (like 'a'), major (like 'F#') and pentatonic (like 'A5'),
+                named scales like 'D:dorian' (ionian, dorian, phrygian, lydian,
+                mixolydian, aeolian, locrian, hminor, mminor, penta, chromatic)
+                or semitone intervals like 'C:0,2,3,7,8'
+-r --range a:b  restrict played notes to a chromatic range between a and b, 
+                which can be MIDI note numbers or strings like 'F#3'
+-n --note C2    fixed note (overwritten by note behavior), can be either a
+                MIDI note number (like 36) or a string like 'F#3' 
+-g --gliss      plays a new note once the poti moves by a sufficient angle
+-l --legato     play legato, i.e. play next note befor stopping the previous one
+-a --arp        arpeggio on incoming notes
+-p --pattern    arpeggiator pattern, can be 'up', 'down', 'triangle' (up
+                and down), 'random' or a pattern of note positions
+                separated by colons, like for example 1:3:5:2:4
+-q --quant      use MIDI clock input for quantization (this 
+                only affects arpeggio mode)
+-o --oct <k>    number of octaves spanned by the poti
+-G --gamma <x>  correct poti curve using power function with power x
+-t --trig cc<i> add cc events (127/0) to note on/off events
+   --lforate <hz> control rate of all LFOs (default: 67)
+   --lookahead <ms>  send events through an ALSA queue, timestamped to play
+                  this long after they are due; hides thread wake-up
+                  jitter at the cost of a constant delay (default: 0,
+                  direct output)
+   --log <level>  log level for debug.log: debug (default), info, warning,
+                  error or off
+   --latency      trace input to MIDI output latency per command type,
+                  printed on exit and on SIGUSR1
+   --metrics <file>  write a snapshot of runtime metrics (queue depth, drops,
+                  command and MIDI event rates, Bluetooth traffic, LFO
+                  overruns, watchdog and thread state) to file every second
+   --seed <n>     seed for the arpeggiator's random mode
+
+Capture and replay:
+   --capture <file>  record all commands of the session to file
+   --replay <file>   replay a capture instead of connecting to the cube; the
+                  captured options apply, options given here are added
+   --fast         replay as fast as possible on a virtual clock and write
+                  the resulting events as text instead of playing them
+   --dump <file>  file for the events of --fast (default: stdout)
+   --render <file.mid>  render the replay offline into a Standard MIDI File,
+                  as fast as possible on a virtual clock
+"""
+
+def parseArgs(argv):
+    p = Params()
+    # lists of their own, the class defaults are shared by all instances
+    p.controllers = []
+    p.lfos = []
+    p.triggerCCs = []
+    def addBehavior(beh, axis=0):
+        if beh == 'note':
+            p.setNote = True
+            p.axisNote = axis
+        elif beh == 'bend':
+            p.setBend = True
+            p.axisBend = axis
+        elif beh == 'speed':
+            p.setSpeed = True 
+            p.axisSpeed = axis
+        elif beh == 'vel':
+            p.setVelocity = True
+            p.axisVel = axis
+        else:
+            m = re.match('^cc(\d+)$', beh)
+            if m:
+                cc = int(m.group(1))
+                p.controllers.append((cc, axis))
+                return
+            m = re.match('^lfo(\d+):([a-z]+)$', beh)
+            if m:
+                cc = int(m.group(1))
+                wav = m.group(2)
+                if not wav in ['sin', 'tri', 'saw', 'sqr']:
+                    print "Unknown wave form '" + wav + "'"
+                    usage()
+                    exit(2)
+                p.lfos.append((cc, wav))
+                p.axisLfo = axis
+                return
+            m = re.match('^lfo(\d+)$', beh)
+            if m:
+                cc = int(m.group(1))
+                p.lfos.append((cc, 'sin'))
+                p.axisLfo = axis
+                return
+            m = re.match('^wah(\d+)$', beh)
+            if m:
+                cc = int(m.group(1))
+                p.lfos.append((cc, 'wah'))
+                p.axisLfo = axis
+                return
+            usage()
+            exit(2)
+    def setNote(s):
+        m = re.match('^(\d+)$', s)
+        if m:
+            p.note = int(s)
+            return
+        m =re.match('^([a-hA-H]#?)(\d)$',s)
+        if m:
+            n = m.group(1)
+            o = int(m.group(2))
+            p.note = util.getNote(n,o)
+            return
+        usage()
+        exit(2)
+    def setRange(s):
+        m = re.match('^(\d+):(\d+)$', s)
+        if m:
+            p.rang = (int(m.group(1)), int(m.group(2)))
+            return
+        m = re.match('^([a-hA-H]#?)(\d):([a-hA-H]#?)(\d)$',s)
+        if m:
+            n1 = m.group(1)
+            o1 = int(m.group(2))
+            n2 = m.group(3)
+            o2 = int(m.group(4))
+            p.rang = (util.getNote(n1,o1), util.getNote(n2,o2))
+            return
+        usage()
+        exit(2)
+    def addTrigger(s):
+        m = re.match('^-?cc(\d+)$', s)
+        if m:
+            inv = s.startswith('-')
+            sgn = -1*inv + 1*(not inv)
+            p.triggerCCs.append(sgn*int(m.group(1))) 
+        else:
+            usage()
+            exit(2)
+    shortOpts = "b:x:y:z:s:glqao:n:m:c:p:G:t:r:"
+    longOpts = ["behavior=","scale=","range=","chan=","quant","note=","gamma=","legato", 
+                "gliss","arp","oct=","mac=","midiout=","midiin=", "pattern=","trig=",
+                "lforate=","binary","log=","latency","metrics=","seed=","capture=","replay=",
+                "fast","dump=","render=","lookahead="]
+    try:
+        opts, args = getopt.getopt(argv, shortOpts, longOpts)
+    except getopt.GetoptError:
+        usage()
+        exit(2)
+    for opt,arg in opts:
+        if opt in ["-g", "--gliss"]:
+            p.gliss = True
+        elif opt in ["-l", "--legato"]:
+            p.legate = True
+        elif opt in ["-a", "--arp"]:
+            p.arp = True
+        elif opt in ["-p", "--pattern"]:
+            p.pattern = arg
+        elif opt in ["-q", "--quant"]:
+            p.quant = True
+        elif opt in ["-o", "--oct"]:
+            p.octaves = int(arg)
+        elif opt in ["-s", "--scale"]:
+            p.scale = str(arg)
+            if util.parseScale(p.scale) is None:
+                print "Unknown scale '" + p.scale + "'"
+                usage()
+                exit(2)
+        elif opt in ["-n", "--note"]:
+            setNote(arg)
+        elif opt in ["-r", "--range"]:
+            setRange(arg)
+        elif opt in ["-b", "--behavior", "-x"]:
+            addBehavior(arg)
+        elif opt == "-y":
+            addBehavior(arg, axis=1)
+        elif opt == "-z":
+            addBehavior(arg, axis=2)
+        elif opt in ["-t", "--trig"]:
+            addTrigger(arg)
+        elif opt in ["-m", "--mac"]:
+            p.btMAC = arg
+        elif opt in ["-c", "--chan"]:
+            p.midiChan = int(arg)
+        elif opt in ["-G", "--gamma"]:
+            p.gamma = float(arg)
+        elif opt == "--log":
+            if not arg in log.LEVELS:
+                usage()
+                exit(2)
+            p.logLevel = arg
+        elif opt == "--binary":
+            p.binary = True
+        elif opt == "--latency":
+            p.latency = True
+        elif opt == "--metrics":
+            p.metrics = arg
+        elif opt == "--seed":
+            p.seed = int(arg)
+        elif opt == "--capture":
+            p.capture = arg
+        elif opt == "--replay":
+            p.replay = arg
+        elif opt == "--fast":
+            p.fast = True
+        elif opt == "--dump":
+            p.dump = arg
+        elif opt == "--render":
+            p.render = arg
+        elif opt == "--lookahead":
+            p.lookahead = float(arg) / 1000
+            if p.lookahead < 0:
+                usage()
+                exit(2)
+        elif opt == "--lforate":
+            p.lfoRate = float(arg)
+            if p.lfoRate <= 0:
+                usage()
+                exit(2)
+        elif opt == "--midiout":
+            m = re.match('(\d+):(\d+)', arg)
+            if m:
+                p.alsaOut = (int(m.group(1)), int(m.group(2)))
+            else:
+                usage()
+                exit(2)
+        elif opt == "--midiin":
+            m = re.match('(\d+):(\d+)', arg)
+            if m:
+                p.alsaIn = (int(m.group(1)), int(m.group(2)))
+            else:
+                usage()
+                exit(2)
+        else:
+            usage()
+            exit(2)
+    return p
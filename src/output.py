@@ -0,0 +1,167 @@
+import threading
+import logging
+import collections
+import alsaseq
+import clock
+import events
+import metrics
+
+# MIDI output subsystem. Producers (scheduler, timer wheel, LFOs) hand
+# the pre-encoded events of one step to an Output, which passes them on
+# to a backend. A threaded Output appends (events, due, cause) steps to a deque
+# (append and popleft are atomic under the GIL) and a single writer
+# thread drains it in batches, in the order written. Producers never
+# block on output. When the ring is full, new steps of controllers and
+# pitch bend only are dropped and counted, while steps with notes are
+# queued beyond the capacity, so no note on or off is ever lost. Without
+# a thread, steps go straight to the backend, which replays and offline
+# rendering use to stay deterministic.
+
+# Backends take lists of (events, due, cause) steps, due being the time
+# the events were meant to be played or None. Backends with timed set
+# need it. For steps of a traced command, cause is the command and due
+# its arrival stamp, else cause is None.
+class Backend:
+    timed = False
+
+    def write(self, steps):
+        pass
+
+    def close(self):
+        pass
+
+# ALSA sequencer, with a lookahead the events are stamped for the queue
+# to play lookahead seconds after they were due (see events.delayed).
+# The queue sorts by time, while steps are written in the order they
+# changed the state; a step handled late, like a TRG_OFF that arrived
+# just before a timed strike, would be played before the strike and leave
+# its note hanging. Due times are therefore clamped to never go back.
+# With a latency tracer, traced steps record the time from the arrival of
+# their command to the moment their events were handed to ALSA.
+class AlsaBackend (Backend):
+    def __init__(self, lookahead=0.0, queue=None, latency=None, clock=clock.now):
+        self.lookahead = lookahead
+        self.queue = queue      # id of our queue, needed with a lookahead
+        self.latency = latency
+        self.timed = lookahead > 0
+        self.now = clock
+        self.last = 0.0         # latest due time written
+
+    def write(self, steps):
+        output = alsaseq.output
+        latency = self.latency
+        if not self.timed:
+            for (out, due, cause) in steps:
+                for event in out:
+                    output(event)
+                if cause is not None and latency is not None:
+                    latency.record(cause, due, self.now())
+            return
+        now = self.now()
+        for (out, stamp, cause) in steps:
+            due = stamp
+            if due is None:
+                due = now
+            if due < self.last:
+                due = self.last
+            self.last = due
+            delay = self.lookahead + due - now
+            for event in out:
+                output(events.delayed(event, delay, self.queue))
+            if cause is not None and latency is not None:
+                latency.record(cause, stamp, self.now())
+
+# keeps (time, event) pairs for tests, benchmarks, replays and rendering
+class MemoryBackend (Backend):
+    def __init__(self, clock=clock.now):
+        self.now = clock
+        self.events = []
+
+    def write(self, steps):
+        now = self.now()
+        for (out, due, cause) in steps:
+            self.events.extend([(now, event) for event in out])
+
+# discards all events
+class NullBackend (Backend):
+    def __init__(self):
+        self.written = 0
+
+    def write(self, steps):
+        for (out, due, cause) in steps:
+            self.written += len(out)
+
+def notes(out):
+    for event in out:
+        if event[0] == events.NOTEON or event[0] == events.NOTEOFF:
+            return True
+    return False
+
+class Output:
+    def __init__(self, backend, threaded=True, capacity=4096):
+        self.backend = backend
+        self.timed = backend.timed
+        self.threaded = threaded
+        self.capacity = capacity
+        self.ring = collections.deque()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stopped = False
+        self.lock = threading.Lock()    # for dropped, counted by all producers
+        self.dropped = 0        # steps lost on a full ring
+        self.batches = 0        # batches handed to the backend
+        metrics.registry.gauge('output.depth', lambda: len(self.ring))
+        metrics.registry.gauge('output.dropped', lambda: self.dropped)
+
+    # write the events of one step, a list the caller no longer changes
+    def write(self, out, due=None, cause=None):
+        if not self.threaded:
+            self.backend.write([(out, due, cause)])
+            return True
+        if len(self.ring) >= self.capacity and not notes(out):
+            with self.lock:
+                self.dropped += 1
+            return False
+        self.ring.append((out, due, cause))
+        if not self.wakeup.isSet():
+            self.wakeup.set()
+        return True
+
+    def drain(self):
+        batch = []
+        pop = self.ring.popleft
+        try:
+            while True:
+                batch.append(pop())
+        except IndexError:
+            pass
+        if batch:
+            self.backend.write(batch)
+            self.batches += 1
+
+    def run(self):
+        while not self.stopped:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.drain()
+        self.drain()
+
+    def start(self):
+        if self.threaded and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='output')
+            self.thread.daemon = True
+            self.thread.start()
+
+    # Stop the writer, which writes what is pending before it exits. Only
+    # once it is gone is the rest written from here, so the backend never
+    # has two writers.
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(1)
+            if self.thread.isAlive():
+                logging.warning("output writer did not stop, %i steps not written" % len(self.ring))
+                return
+        self.drain()
+        self.backend.close()
@@ -18,6 +18,21 @@ class Params:
     alsaOut = None
     alsaIn = None
     midiChan = 1
+    binary = False     # request binary position frames
+    logLevel = 'debug' # level for debug.log
+    latency = False    # trace input to output latency
+    metrics = None     # file for periodic metrics snapshots
+    metricsInterval = 1.0 # seconds between metrics snapshots
+    status = True      # print the status line
+    seed = None        # seed for the arpeggiator's random mode
+    capture = None     # file recording all commands
+    replay = None      # capture file to replay instead of using the cube
+    fast = False       # replay as fast as possible on a virtual clock
+    dump = None        # text file for the events of a fast replay
+    render = None      # MIDI file rendered from a replay
+    renderTail = 1.0   # seconds rendered after the last command
+    lookahead = 0.0    # delay of timestamped output on an ALSA queue, 0 = direct
+    queue = None       # id of the ALSA queue of our client, found at startup
 
     # behavior that can be enabled for the poti
     # one-shot mode and for rapid-fire mode
@@ -26,6 +41,14 @@ class Params:
     setVelocity = False
     setSpeed    = False
 
-    # controllers and LFOs associated to poti
+    # axis (0=X, 1=Y, 2=Z) driving each behavior, the poti is X
+    axisNote    = 0
+    axisBend    = 0
+    axisSpeed   = 0
+    axisVel     = 0
+    axisLfo     = 0
+
+    # controllers (cc, axis) and LFOs associated to poti
     controllers = []
     lfos = []
+    lfoRate = 67       # LFO control rate in Hz
@@ -0,0 +1,48 @@
+import time
+import clock
+import sync
+
+# Replay of captured sessions (see capture.py), either at real speed
+# through the command bus into a running scheduler, or as fast as
+# possible into a scheduler on a virtual timer wheel. The random mode of
+# the arpeggiator is seeded from the captured command line, so fast
+# replays of a capture always produce the same events.
+
+# feed the commands to the bus with their original spacing
+def realtime(records):
+    if not records:
+        return 0
+    start = records[0][0]
+    origin = clock.now()
+    n = 0
+    for (stamp, cmd) in records:
+        if sync.terminate.isSet():
+            break
+        delay = origin + (stamp - start) - clock.now()
+        if delay > 0:
+            time.sleep(delay)
+        sync.putCommand(cmd)
+        n += 1
+    return n
+
+# Run the commands through scheduler.handle, firing due timer events of
+# the virtual wheel (notes, LFO samples) in between. Virtual time starts
+# at zero with the first command; the wheel runs on until the given time
+# after the last command. Returns the virtual duration.
+def fast(records, scheduler, wheel, tail=0.0):
+    if not records:
+        return 0.0
+    start = records[0][0]
+    wheel.now.time = 0.0
+    scheduler.lfoEngine.start()
+    for (stamp, (cmd, value)) in records:
+        wheel.advance(stamp - start)
+        scheduler.handle(cmd, value, stamp - start)
+    wheel.advance(wheel.now() + tail)
+    scheduler.lfoEngine.stop()
+    return wheel.now()
+
+# write (time, event) pairs as text lines, e.g. for diffing replays
+def dump(events, out):
+    for (when, event) in events:
+        out.write("%.6f %r\n" % (when, event))
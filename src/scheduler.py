@@ -1,95 +1,35 @@
 import time
 import threading
-import alsaseq
 import sys
 import logging
 
-from threading import Timer
-from numpy import interp,sin
-from math import pi
 from alsamidi import *
 
 import sync
 import command
 import arpeg
+import clock
+import events
+import log
+import metrics
+import tempo
 
-from util import *
-from params import *
-
-class LFO:
-    def __init__(self, cc, wav, params):
-        self.wav = wav         # Waveform
-        self.cc = cc           # index of MIDI controller to write
-        self.params = params   # global parameters
-        self.value = 0         # current value of MIDI cc
-        self.freq = 1.0        # LFO frequency in Hz
-        self.amplitude = 1.0   # LFO amplitude
-        self.rate = 67         # sample rate
-        self.period = 1.0 / self.rate # sample period
-        self.resolution = 256  # samples per period
-        self.tick = 0.0        # local time measure (once per sample)
-        self.dispatcher = None # timer to trigger value changes
-        self.initSamples(wav)
-
-    def initSamples(self, wav):
-        self.samples = []
-        if wav in ['sin', 'wah']:
-            step = 2*pi / self.resolution
-            def makeSample(x):
-                return int(interp(sin(x*step), [-1,1], [0,127]))
-            self.samples = map(makeSample, range(0, self.resolution))
-            if wav == 'wah':
-                self.amplitude = 0.0
-        elif wav == 'tri':
-            xkeys = [0, 0.25*self.resolution, 0.75*self.resolution, self.resolution]
-            ykeys = [64, 127, 0, 64]
-            def makeSample(x):
-                return int(interp(x, xkeys, ykeys))
-            self.samples = map(makeSample, range(0, self.resolution))
-        elif wav == 'saw':
-            def makeSample(x):
-                return (64 + int(interp(x, [0, self.resolution], [0, 127]))) % 128
-            self.samples = map(makeSample, range(0, self.resolution))
-        elif wav == 'sqr':
-            def makeSample(x):
-                if x < 0.5*self.resolution:
-                    return 127
-                else:
-                    return 0
-            self.samples = map(makeSample, range(0, self.resolution))
-        else:
-            self.samples = [0]*self.resolution
-
-    def stop(self):
-        if self.dispatcher:
-            self.dispatcher.cancel()
-            self.dispatcher = None
-
-    def sample(self):
-        # increase time wrt last sample time
-        self.tick = (self.tick + self.period * self.resolution * self.freq) % self.resolution
-        newValue = 64 + int(self.amplitude * (self.samples[int(self.tick)] - 64))
-        if self.value <> newValue:
-            self.value = newValue
-            alsaseq.output(ccEvent(self.cc, self.value, chan=self.params.midiChan))
-        self.dispatcher = Timer(self.period, self.sample)
-        self.dispatcher.start()
-
-    def start(self):
-        self.sample()
+from lfo import LFO, LFOEngine
+from mapping import PotMap, POT_MAX, angleToPot
+from latency import LatencyTracer
+from output import Output, AlsaBackend
 
-    def setFrequency(self, f):
-        self.freq = f
+AXES = 3 # X, Y, Z
 
-    def setAmplitude(self, a):
-        self.amplitude = a
+from util import *
+from params import *
 
 class State:
-    pot       = 0               # poti position
-    cc        = 64              # mapped cc position
+    pos       = [0, 0, 0]       # axis positions (poti is X)
+    cc        = [64, 64, 64]    # mapped cc position per axis
     lfos      = []              # low frequency oscillators
     trigger   = False           # trigger is on
-    bendOffs  = 0.0             # offset for pitch bend
+    bendOffs  = 0               # offset for pitch bend
     bend      = 8192            # pitch bend value
     bpm       = 120             # rapid fire speed (free-wheeling)
     tickMod   = 12              # rapid fire speed (quantised)
@@ -97,233 +37,334 @@ class State:
     running   = False           # MIDI transport status    
     
 class Scheduler (threading.Thread):
-    def __init__(self, params):
+    # wheel and output default to a real-time timer wheel and a threaded
+    # output to the ALSA sequencer; replays and offline rendering pass
+    # their own
+    def __init__(self, params, wheel=None, output=None):
         threading.Thread.__init__(self)
         self.params = params
-        self.params = params
-        self.dispatcher = None
-        self.lastStrike = None
+        self.dispatcher = None  # next strike of the free-running arpeggio
+        self.strike = None      # quantised strike scheduled ahead of its tick
+        self.strikeTick = None  # tick of that strike
+        self.follower = tempo.ClockFollower()
         self.lastNote   = None
+        self.wheel = wheel or clock.TimerWheel()
+        self.map = PotMap(params)
+        self.lock = threading.Lock()    # taken by every step, see handle()
+        self.midi = metrics.registry.tally('midi', events.names)
+        self.latency = None
+        if params.latency:
+            self.latency = LatencyTracer()
+        self.writer = output or Output(AlsaBackend(params.lookahead, params.queue, self.latency))
+        chan = params.midiChan
+        self.triggerOn = events.controlGroup(params.triggerCCs, 127, chan=chan)
+        self.triggerOff = events.controlGroup(params.triggerCCs, 0, chan=chan)
+        self.controllers = [tuple([cc for (cc, axis) in params.controllers if axis == i])
+                            for i in range(AXES)]
         self.state = State()
-        self.arpeg = arpeg.Arpeggiator(params.pattern)
+        self.state.pos = [0] * AXES
+        self.state.cc = [64] * AXES
+        self.state.lfos = []
+        self.state.bpm = self.bpm()
+        self.grid = tempo.PhaseAccumulator(self.state.bpm / 60.0)
+        self.arpeg = arpeg.Arpeggiator(params.pattern, params.seed)
         for lfo in params.lfos:
             cc, wav = lfo
-            self.state.lfos.append(LFO(cc, wav, params))
+            self.state.lfos.append(LFO(cc, wav))
+        self.lfoEngine = LFOEngine(self.state.lfos, params, self.wheel, self.output)
 
     def printStatus(self):
+        if not self.params.status:
+            return
         def bool2str(b):
             if b:
                 return '*'
             else:
                 return ' '
-        sys.stdout.write("[POT:%4i] [TRG: %s]\r" 
-                         % (self.state.pot, self.state.trigger))
+        beat = ""
+        bpm = self.follower.bpm()
+        if self.params.quant and bpm is not None:
+            beat = " [BPM:%6.1f +-%4.1f ms]" % (bpm, 1000 * self.follower.jitter)
+        sys.stdout.write("[POS:%4i %4i %4i] [TRG: %s]%s\r" 
+                         % (tuple(self.state.pos) + (self.state.trigger, beat)))
         sys.stdout.flush()
 
     def pitch(self):
         if self.params.arp:
             if self.params.setNote:
-                shift = int(interp(self.state.pot, [0,1023], [-8,8]))
+                shift = self.map.shift[self.state.pos[self.params.axisNote]]
             else:
                 shift = 0
             note = self.arpeg.getNote(shift)
             return note
         else:
-            if self.params.scale is None:
-                noteRange = 12 * self.params.octaves
-            else:
-                noteRange = 7 * self.params.octaves
             if self.params.setNote:
-                if self.params.rang:
-                    return int(interp(self.state.pot, [0, 1023], [self.params.rang[0], self.params.rang[1]]))
-                else:
-                    noteIndex = int(interp(self.state.pot, [0,1023], [-noteRange,noteRange]))
-                    return noteOnScale(self.params.scale, noteIndex)
+                return self.map.note[self.state.pos[self.params.axisNote]]
             else:
                 return self.params.note
 
-    def stopNote(self):        
+    def stopNote(self, out):
         if self.lastNote is None:
             return
         else:
-            alsaseq.output(noteOffEvent(self.lastNote, chan=self.params.midiChan))
+            note = self.lastNote
+            out.add(events.noteOff(note.pitch, note.velocity, chan=self.params.midiChan))
+            out.extend(self.triggerOff)
             self.lastNote = None
-            for cc in self.params.triggerCCs:
-                alsaseq.output(ccEvent(cc, 0, chan=self.params.midiChan))
-            logging.debug("stop note %s" % str(self.lastNote))
+            log.debug("stop note %s", note)
 
-    def playNote(self):
+    def playNote(self, out):
         if self.lastNote:
             self.arpeg.next()
         if not self.params.legato: 
-            self.stopNote()
+            self.stopNote(out)
         note = Note(self.pitch())
         if note.valid():
-            alsaseq.output(noteOnEvent(note, chan=self.params.midiChan))
-            for cc in self.params.triggerCCs:
-                alsaseq.output(ccEvent(cc, 127, chan=self.params.midiChan))
-            logging.debug("play note %s" % str(note))
+            out.add(events.noteOn(note.pitch, note.velocity, chan=self.params.midiChan))
+            out.extend(self.triggerOn)
+            log.debug("play note %s", note)
             if (self.params.legato):
-                self.stopNote()
+                self.stopNote(out)
             self.lastNote = note
-        self.lastStrike = time.time()
-        if not self.params.quant and self.params.arp: 
-            duration = 60.0 / self.bpm()
-            self.dispatcher = self.scheduleNote(duration)
 
-    def scheduleNote(self, duration):
-        timer = Timer(duration, self.playNote)
-        timer.start()
-        logging.debug("dispatch note in %f s" % duration)
-        return timer
+    # Hand the events of one step to the output writer with the time they
+    # were due: the arrival of the command that caused them, or the
+    # deadline of the timer event. Steps caused by a traced command carry
+    # it along, the backend records their latency once they are written.
+    def output(self, out, due=None, cause=None):
+        if not out:
+            return
+        midi = self.midi
+        for event in out:
+            midi.inc(event[0])
+        self.writer.write(out, due, cause)
+
+    # start the free-running arpeggio on the tempo grid
+    def startGrid(self):
+        self.grid.start(self.wheel.now())
+        self.dispatcher = self.wheel.event(self.strikeNote)
+        self.wheel.reschedule(self.dispatcher, self.grid.next())
+
+    # timer action striking the notes after the first
+    def strikeNote(self):
+        with self.lock:
+            event = self.dispatcher
+            if self.state.trigger and event is not None:
+                out = events.Batch()
+                self.playNote(out)
+                self.output(out, self.wheel.due)
+                when = self.grid.next()
+                self.wheel.reschedule(event, when)
+                log.debug("dispatch note at %f", when)
+
+    def cancelNote(self):
+        if self.dispatcher:
+            self.wheel.cancel(self.dispatcher)
+            self.dispatcher = None
+            log.debug("cancel dispatched note")
+        self.cancelStrike()
+
+    def cancelStrike(self):
+        if self.strike:
+            self.wheel.cancel(self.strike)
+            self.strike = None
+            self.strikeTick = None
+
+    # Quantised strike on MIDI clock. Once the follower is locked to the
+    # clock, each strike is scheduled on the wheel one tick ahead, for the
+    # expected arrival of its tick, so it neither waits for the tick to
+    # make it through the bus nor inherits its jitter. Ticks only strike
+    # themselves when no strike was scheduled for them.
+    def followClock(self, out):
+        ticks = self.state.ticks
+        mod = self.state.tickMod
+        if ticks % mod == 0 and self.strikeTick != ticks:
+            self.playNote(out)
+        if (ticks + 1) % mod == 0 and self.follower.locked():
+            self.strikeTick = ticks + 1
+            self.strike = self.wheel.scheduleAt(self.follower.predict(), self.strikeAhead)
+
+    def strikeAhead(self):
+        with self.lock:
+            if self.state.trigger:
+                out = events.Batch()
+                self.playNote(out)
+                self.output(out, self.wheel.due)
 
     def bpm(self):
         if not self.params.setSpeed:
             return 120
         else:
-            return int(interp(self.state.pot, [0,512,1023], [30,120,480]))
+            return self.map.bpm[self.state.pos[self.params.axisSpeed]]
 
     def setBPM(self):
         newBPM = self.bpm()
         if self.state.bpm <> newBPM:
-            if self.dispatcher:
-                self.dispatcher.cancel()
-                self.dispatcher = None
-                logging.debug("cancel dispatched note")
             self.state.bpm = newBPM
-            if self.state.trigger:
-                duration = 60.0 / newBPM
-                now = time.time()
-                elapsed = now - self.lastStrike
-                if elapsed > duration: # preemption
-                    self.playNote() 
-                else:                  # delay next strike
-                    rest = duration - elapsed
-                    self.dispatcher = self.scheduleNote(rest)
+            self.grid.setRate(newBPM / 60.0, self.wheel.now())
+            # move the next strike, or strike now if the beat was passed
+            if self.dispatcher and self.dispatcher.pending():
+                self.wheel.reschedule(self.dispatcher, self.grid.deadline())
+                log.debug("move dispatched note")
 
     def setQuantisation(self):
-        mods = [48, 36, 32, 24, 18, 16, 12, 8, 6, 4, 3, 2]
         mod = 12
         if self.params.setSpeed:
-            p = self.state.pot
-            i = int(interp(p, [0,512,1023], [0,6,11]))
-            mod = mods[i]
+            mod = self.map.tickMod[self.state.pos[self.params.axisSpeed]]
         self.state.tickMod = mod
 
     def bend(self):
         if not self.params.setBend:
             return 8192
         else:
-            centered = self.state.pot - self.state.bendOffs
-            return int(interp(centered, [-1023,1023], [0, 16383]))
+            centered = self.state.pos[self.params.axisBend] - self.state.bendOffs
+            return self.map.bend[centered + POT_MAX]
 
-    def setBend(self):
+    def setBend(self, out):
         newBend = self.bend()
         if self.state.bend != newBend:
             self.state.bend = newBend
-            alsaseq.output(pitchBendEvent(newBend, chan=self.params.midiChan))
+            out.add(events.bend(newBend, chan=self.params.midiChan))
 
-    def resetBend(self):
+    def resetBend(self, out):
         if self.params.setBend:
-            self.state.bendOffs = self.state.pot
+            self.state.bendOffs = self.state.pos[self.params.axisBend]
             self.state.bend = 8192
-            alsaseq.output(pitchBendEvent(self.state.bend, chan=self.params.midiChan))
+            out.add(events.bend(self.state.bend, chan=self.params.midiChan))
 
-    def setControllers(self):
-        newCC = int(interp(self.state.pot, [0,1023], [0,127]))
-        if newCC <> self.state.cc:
-            self.state.cc = newCC
-            for cc in self.params.controllers:
-                alsaseq.output(ccEvent(cc, newCC, chan=self.params.midiChan))
+    def setControllers(self, out, moved):
+        for axis in range(AXES):
+            ccs = self.controllers[axis]
+            if ccs and moved & (1 << axis):
+                newCC = self.map.cc[self.state.pos[axis]]
+                if newCC <> self.state.cc[axis]:
+                    self.state.cc[axis] = newCC
+                    out.extend(events.controlGroup(ccs, newCC, chan=self.params.midiChan))
 
     def setFreq(self):
-        freq = interp(self.state.pot, [0,1023], [0.1, 8])
-        for lfo in self.state.lfos:
-            lfo.setFrequency(freq)
-            if lfo.wav == 'wah':
-                amp = interp(self.state.pot, [0,1023], [0.0, 1.0])
-                lfo.setAmplitude(amp)
+        pot = self.state.pos[self.params.axisLfo]
+        self.lfoEngine.setFrequency(self.map.freq[pot])
+        self.lfoEngine.setWahAmplitude(self.map.amp[pot])
 
     # Gamma correction
     def curve(self, pot):
-        if not self.params.gamma:
-            return pot
-        else:
-            return int((pot/1023.0)**self.params.gamma * 1023)
+        return self.map.curve[min(POT_MAX, max(0, pot))]
+
+    def setPoti(self, out, x):
+        self.setAxes(out, (x, None, None))
 
-    def setPoti(self, x):
-        self.state.pot = self.curve(x)
+    # update all axes of one position frame, then evaluate every
+    # behavior once if the axis it is bound to moved
+    def setAxes(self, out, pots):
+        pos = self.state.pos
+        moved = 0
+        for axis in range(AXES):
+            if pots[axis] is not None:
+                p = self.curve(pots[axis])
+                if p != pos[axis]:
+                    pos[axis] = p
+                    moved |= 1 << axis
+        if not moved:
+            return
+        params = self.params
         self.printStatus()
-        self.setBend()
-        self.setFreq()
-        if self.params.arp:
-            if self.params.quant:
+        if moved & (1 << params.axisBend):
+            self.setBend(out)
+        if moved & (1 << params.axisLfo):
+            self.setFreq()
+        if params.arp and moved & (1 << params.axisSpeed):
+            if params.quant:
                 self.setQuantisation()
             else:
                 self.setBPM()
         if self.state.trigger:
-            self.setControllers()
-            if self.params.gliss:
+            self.setControllers(out, moved)
+            if params.gliss and moved & (1 << params.axisNote):
                 newPitch = self.pitch()
                 if self.lastNote is not None:
                     if newPitch != self.lastNote.pitch:
-                        self.resetBend()
-                        self.playNote()                    
+                        self.resetBend(out)
+                        self.playNote(out)
+
+    # Handle one command from the bus, stamped with its arrival, and write
+    # the events of the step. Commands and timer actions run on different
+    # threads; each step holds the lock, so steps never interleave and
+    # reach the output in the order they changed the state.
+    def handle(self, cmd, params, stamp=None, traced=False):
+        out = events.Batch()
+        with self.lock:
+            self.step(out, cmd, params, stamp)
+            self.output(out, stamp, traced and cmd or None)
+
+    def step(self, out, cmd, params, stamp):
+        if cmd == command.TRG_ON:
+            log.debug("received TRG_ON")
+            if not self.state.trigger:
+                self.state.trigger = True
+                self.resetBend(out)
+                self.arpeg.reset()
+                self.playNote(out)                    
+                if self.params.arp and not self.params.quant:
+                    self.startGrid()
+        elif cmd == command.TRG_OFF:
+            log.debug("received TRG_OFF")
+            if self.state.trigger:
+                self.state.trigger = False
+                self.cancelNote()
+                self.stopNote(out)                    
+        elif cmd == command.SET_POT:
+            log.debug("received SET_POT")
+            x = params
+            self.setPoti(out, x)
+        elif cmd == command.SET_POS:
+            self.setAxes(out, [angleToPot(a) for a in params])
+        elif cmd == command.PSH_NOTE:
+            self.arpeg.pushNote(params)
+            log.debug("arpeggiator push note %i", params)
+        elif cmd == command.POP_NOTE:
+            self.arpeg.popNote(params)
+            log.debug("arpeggiator pop note %i", params)
+        elif cmd == command.TRP_START:
+            self.state.running = True
+            self.state.ticks = 0
+            self.follower.reset()
+            self.cancelStrike()
+            if self.params.arp and self.params.quant and self.state.trigger:
+                self.arpeg.reset()
+                self.playNote(out)
+            log.debug("transport start")
+        elif cmd == command.TRP_STOP:
+            self.state.running = False
+            self.follower.reset()
+            self.cancelStrike()
+            log.debug("transport stop")
+        elif cmd == command.TRP_TICK:
+            self.state.ticks = self.state.ticks + 1
+            if stamp is None:
+                stamp = self.wheel.now()
+            self.follower.tick(stamp)
+            if self.state.trigger and self.params.arp and self.params.quant:
+                self.followClock(out)
+        else:
+            logging.warning("Illegal command in queue")
 
     def run(self):
         print "starting scheduler"
-        for lfo in self.state.lfos:
-            lfo.start()
+        self.writer.start()
+        self.wheel.start()
+        self.lfoEngine.start()
         while not sync.terminate.isSet():
-            sync.queueEvent.wait()
-            sync.queueEvent.clear()
-            while not sync.queue.empty():
-                sync.qLock.acquire()
-                (cmd, params) = sync.queue.get()
-                sync.qLock.release()
-                if cmd == command.TRG_ON:
-                    logging.debug("received TRG_ON")
-                    if not self.state.trigger:
-                        self.state.trigger = True
-                        self.resetBend()
-                        self.arpeg.reset()
-                        self.playNote()                    
-                elif cmd == command.TRG_OFF:
-                    logging.debug("received TRG_OFF")
-                    if self.state.trigger:
-                        self.state.trigger = False
-                        if self.dispatcher:                        
-                            self.dispatcher.cancel()
-                            self.dispatcher = None
-                            logging.debug("cancel dispatched note")
-                        self.stopNote()                    
-                elif cmd == command.SET_POT:
-                    logging.debug("received SET_POS")
-                    x = params
-                    self.setPoti(x)
-                elif cmd == command.PSH_NOTE:
-                    self.arpeg.pushNote(params)
-                    logging.debug("arpeggiator push note %i" % params)
-                elif cmd == command.POP_NOTE:
-                    self.arpeg.popNote(params)
-                    logging.debug("arpeggiator pop note %i" % params)
-                elif cmd == command.TRP_START:
-                    self.state.running = True
-                    self.state.ticks = 0
-                    if self.params.arp and self.params.quant and self.state.trigger:
-                        self.arpeg.reset()
-                        self.playNote()
-                    logging.debug("transport start")
-                elif cmd == command.TRP_STOP:
-                    self.state.running = False
-                    logging.debug("transport stop")
-                elif cmd == command.TRP_TICK:
-                    self.state.ticks = self.state.ticks + 1
-                    if self.state.trigger and self.params.arp and self.params.quant and (self.state.ticks % self.state.tickMod == 0):
-                        self.playNote()
-                else:
-                    logging.warning("Illegal command in queue")
+            traced = self.latency is not None
+            for (cmd, params, stamp) in sync.bus.wait():
+                self.handle(cmd, params, stamp, traced)
         print "stopping scheduler"
-        for lfo in self.state.lfos:
-            lfo.stop()
+        if sync.bus.dropped:
+            logging.warning("dropped %i commands on full bus" % sync.bus.dropped)
+        for c, n in sync.bus.coalesced.items():
+            logging.info("coalesced %i %s updates" % (n, command.cmd2str(c)))
+        self.lfoEngine.stop()
+        self.wheel.stop()
+        self.writer.stop()
+        if self.latency is not None:
+            print self.latency.report()
 
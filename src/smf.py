@@ -0,0 +1,68 @@
+import struct
+import events
+
+# Standard MIDI File writer for offline rendering: collects ALSA event
+# tuples with their time in seconds and writes them as a format 0 file
+# with a single track. The tempo is fixed, so ticks map linearly to
+# seconds; the default of 960 ticks per quarter at 120 BPM resolves
+# about half a millisecond.
+
+STATUS = {events.NOTEON     : 0x90,
+          events.NOTEOFF    : 0x80,
+          events.CONTROLLER : 0xB0,
+          events.PITCHBEND  : 0xE0}
+
+# variable length quantity
+def varLen(n):
+    data = [n & 0x7F]
+    n >>= 7
+    while n:
+        data.append(0x80 | (n & 0x7F))
+        n >>= 7
+    return bytearray(reversed(data))
+
+# channel message bytes of an ALSA event tuple, None for other events
+def message(event):
+    status = STATUS.get(event[0])
+    if status is None:
+        return None
+    data = event[7]
+    chan = data[0] & 0x0F
+    if event[0] == events.CONTROLLER:
+        return bytearray([status | chan, data[4] & 0x7F, data[5] & 0x7F])
+    if event[0] == events.PITCHBEND:
+        value = max(0, min(16383, data[5] + 8192))
+        return bytearray([status | chan, value & 0x7F, value >> 7])
+    return bytearray([status | chan, data[1] & 0x7F, data[2] & 0x7F])
+
+class Writer:
+    def __init__(self, ppq=960, bpm=120):
+        self.ppq = ppq
+        self.tempo = int(round(60e6 / bpm))      # microseconds per quarter
+        self.ticksPerSecond = ppq * 1e6 / self.tempo
+        self.events = []
+        self.skipped = 0
+
+    def add(self, when, event):
+        msg = message(event)
+        if msg is None:
+            self.skipped += 1
+            return
+        self.events.append((int(round(when * self.ticksPerSecond)), msg))
+
+    def track(self):
+        data = bytearray()
+        data += varLen(0) + bytearray([0xFF, 0x51, 3]) + bytearray(struct.pack('>I', self.tempo)[1:])
+        last = 0
+        for (tick, msg) in self.events:   # in output order, i.e. sorted by time
+            data += varLen(max(0, tick - last)) + msg
+            last = max(last, tick)
+        data += varLen(0) + bytearray([0xFF, 0x2F, 0])
+        return data
+
+    def save(self, path):
+        track = self.track()
+        with open(path, 'wb') as f:
+            f.write(struct.pack('>4sIHHH', 'MThd', 6, 0, 1, self.ppq))
+            f.write(struct.pack('>4sI', 'MTrk', len(track)))
+            f.write(track)
@@ -1,7 +1,11 @@
 import threading
-import Queue
-import logging
 import command
+import clock
+import log
+import metrics
+
+from bus import CommandBus
+from util import WakePipe
 
 #class Sync:
  
@@ -9,16 +13,36 @@ resetOK     = threading.Event()
 stopOK      = threading.Event()
 runOK       = threading.Event()
 calibrateOK = threading.Event()
+binaryOK    = threading.Event()
 terminate   = threading.Event()
 disconnect  = threading.Event()
-queueEvent  = threading.Event()
 
-qLock       = threading.Lock()
-queue       = Queue.Queue(100)
+# readable once terminate is set, for threads blocking in select/poll
+wakeup      = WakePipe()
+
+# commands from the listener and ALSA input threads to the scheduler
+bus         = CommandBus(continuous=[command.SET_POT, command.SET_POS],
+                         lossy=[command.TRP_TICK])
+commands    = metrics.registry.tally('commands', command.names)
+
+# capture.Recorder while recording the session
+recorder    = None
+
+metrics.registry.gauge('bus.depth', lambda: len(bus))
+metrics.registry.gauge('bus.dropped', lambda: bus.dropped)
+metrics.registry.gauge('bus.coalesced', lambda: sum(bus.coalesced.values()))
+
+# send a command, stamped with its arrival time unless given
+def putCommand(cmd, stamp=None):
+    if stamp is None:
+        stamp = clock.now()
+    log.debug("send command %s", command.names.get(cmd[0]))
+    commands.inc(cmd[0])
+    if recorder is not None:
+        recorder.record(cmd, stamp)
+    return bus.put(cmd, stamp)
 
-def putCommand(cmd):
-    qLock.acquire()
-    queue.put(cmd)
-    logging.debug("send command %s" % command.cmd2str(cmd))
-    qLock.release()
-    queueEvent.set()
+def shutdown():
+    terminate.set()
+    wakeup.wake()
+    bus.wake()
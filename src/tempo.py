@@ -0,0 +1,108 @@
+import math
+
+# Tempo and phase of an incoming MIDI clock, estimated from the arrival
+# stamps of its ticks by a delay-locked loop: each tick is expected one
+# period after the smoothed time of the previous one, and the error
+# between arrival and expectation corrects both the phase and the period.
+# The bandwidth (in cycles per tick) trades tracking speed against jitter
+# rejection. Errors of more than a period (transport stopped, clock
+# source changed) restart the loop.
+#
+# Predictions are only made once the loop has converged: a freshly
+# measured period can be off by the full arrival jitter, and the loop
+# needs many ticks to pull it in. The jitter estimate starts at a whole
+# period, and the loop counts as converged after a run of ticks that all
+# arrived close to their prediction.
+class ClockFollower:
+    def __init__(self, ppqn=24, bandwidth=0.01, warmup=24):
+        self.ppqn = ppqn
+        omega = 2 * math.pi * bandwidth
+        self.b = math.sqrt(2) * omega   # phase correction per tick
+        self.c = omega * omega          # period correction per tick
+        self.alpha = 0.05               # smoothing of the jitter
+        self.warmup = warmup    # ticks in a row close to the prediction
+        self.tolerance = 0.15   # of a period, for close to the prediction
+        self.period = None      # seconds per tick
+        self.jitter = 0.0       # mean absolute deviation from the prediction
+        self.reset()
+
+    # forget the phase, e.g. on transport start or stop; the period
+    # estimate is kept as the tempo rarely changes across a restart
+    def reset(self):
+        self.phase = None       # smoothed time of the last tick
+        self.settled = 0        # ticks in a row close to the prediction
+        self.converged = False
+
+    def tick(self, stamp):
+        phase = self.phase
+        self.phase = stamp
+        if phase is None:
+            return
+        if self.period is None:
+            self.period = stamp - phase
+            self.jitter = self.period
+            return
+        expected = phase + self.period
+        error = stamp - expected
+        if abs(error) > self.period:
+            # tempo jump or gap: start over from the last interval
+            self.period = stamp - phase
+            self.jitter = self.period
+            self.settled = 0
+            self.converged = False
+            return
+        self.phase = expected + self.b * error
+        self.period += self.c * error
+        self.jitter += self.alpha * (abs(error) - self.jitter)
+        if abs(error) < self.tolerance * self.period:
+            self.settled += 1
+            if self.settled >= self.warmup:
+                self.converged = True
+        else:
+            self.settled = 0
+
+    def locked(self):
+        return self.converged and self.jitter < 0.25 * self.period
+
+    # expected arrival of the k-th tick after the last one
+    def predict(self, k=1):
+        return self.phase + k * self.period
+
+    def bpm(self):
+        if not self.period:
+            return None
+        return 60.0 / (self.period * self.ppqn)
+
+# Beat grid of the free-running arpeggiator as a phase accumulator
+# against a monotonic clock: the phase counts beats since the start at
+# the current rate, and the deadline of beat n is where the phase
+# reaches n. Deadlines are computed from the anchor, never from the time
+# a previous beat was actually played, so late timers do not accumulate.
+# A tempo change re-anchors at the current phase: the phase carries over
+# and only the rest of the current beat runs at the new rate.
+class PhaseAccumulator:
+    def __init__(self, rate):
+        self.rate = rate        # beats per second
+        self.start(0.0)
+
+    def start(self, now):
+        self.anchor = now       # time of the last (re)anchoring
+        self.offset = 0.0       # phase at the anchor
+        self.beat = 0           # beat played or pending last
+
+    def phase(self, now):
+        return self.offset + (now - self.anchor) * self.rate
+
+    def setRate(self, rate, now):
+        self.offset = self.phase(now)
+        self.anchor = now
+        self.rate = rate
+
+    # deadline of the last beat (the pending one)
+    def deadline(self):
+        return self.anchor + (self.beat - self.offset) / self.rate
+
+    # move on to the next beat, returns its deadline
+    def next(self):
+        self.beat += 1
+        return self.deadline()
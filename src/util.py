@@ -2,6 +2,8 @@ import signal
 import time
 import subprocess
 import re
+import os
+import fcntl
 
 class TimeoutError(Exception):
     pass
@@ -21,6 +23,28 @@ class timeout:
     def __exit__(self, type, value, traceback):
         signal.alarm(0)
 
+# self-pipe used to interrupt a thread blocking in select/poll; the read
+# end stays readable until clear() is called
+class WakePipe:
+    def __init__(self):
+        self.r, self.w = os.pipe()
+        for fd in [self.r, self.w]:
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    def fileno(self):
+        return self.r
+    def wake(self):
+        try:
+            os.write(self.w, 'x')
+        except OSError:
+            pass # pipe full, reader is woken anyway
+    def clear(self):
+        try:
+            while os.read(self.r, 4096):
+                pass
+        except OSError:
+            pass
+
 class Note:
     def __init__(self, pitch, velocity=127):
         self.pitch = pitch
@@ -60,6 +84,21 @@ majorScale = [0, 2, 4, 5, 7, 9, 11]
 minorScale = [0, 2, 3, 5, 7, 8, 10]
 pentaScale = [0, 3, 5, 7, 10]
 
+# named scales for keys like 'D:dorian'
+namedScales = {'major'      : majorScale,
+               'minor'      : minorScale,
+               'penta'      : pentaScale,
+               'chromatic'  : range(12),
+               'ionian'     : majorScale,
+               'dorian'     : [0, 2, 3, 5, 7, 9, 10],
+               'phrygian'   : [0, 1, 3, 5, 7, 8, 10],
+               'lydian'     : [0, 2, 4, 6, 7, 9, 11],
+               'mixolydian' : [0, 2, 4, 5, 7, 9, 10],
+               'aeolian'    : minorScale,
+               'locrian'    : [0, 1, 3, 5, 6, 8, 10],
+               'hminor'     : [0, 2, 3, 5, 7, 8, 11],
+               'mminor'     : [0, 2, 3, 5, 7, 9, 11]}
+
 noteNames = ['c', 'c#', 'd', 'd#', 'e', 'f', 
              'f#', 'g', 'g#', 'a', 'a#', 'b']
 basicNote = {'c' : 36,
@@ -82,32 +121,85 @@ def getNote(note, octave):
     base = basicNote.get(note, 36) - 36
     return base + 12*octave
 
-# get MIDI code for a note restricted to a specific scale.
-# note = 0 returns the basic note, negative and positive values 
-# will move down and up on the scale
-def noteOnScale(key = None, note = 0):
-    if key is None:
-        # chromatic scale
-        return basicNote.get('c') + note
+# Note numbers for every scale degree of a key. Degree 0 is the basic
+# note, the table covers all degrees that map into the MIDI range, so a
+# lookup is a single indexing. Scale notes are framed to 1..127, chromatic
+# notes outside the MIDI range are None.
+class ScaleTable:
+    def __init__(self, base, scale, chromatic=False):
+        self.base = base
+        self.scale = scale
+        self.degrees = len(scale)           # scale degrees per octave
+        n = len(scale)
+        self.lowest = -n * (base / 12 + 1)  # lowest degree in table
+        highest = n * ((127 - base) / 12 + 1)
+        def degreeNote(d):
+            note = base + 12 * (d / n) + scale[d % n]
+            if chromatic:
+                if note < 0 or note > 127:
+                    return None
+                return note
+            return max(1, min(127, note))
+        self.notes = [degreeNote(d) for d in range(self.lowest, highest + 1)]
+        self.below = self.notes[0]
+        self.above = self.notes[-1]
+        if chromatic:
+            self.below = self.above = None
 
+    def note(self, degree):
+        i = degree - self.lowest
+        if i < 0:
+            return self.below
+        if i >= len(self.notes):
+            return self.above
+        return self.notes[i]
+
+# parse a key like 'D#' (major), 'a' (minor), 'A5' (pentatonic),
+# 'D:dorian' (named scale) or 'C:0,2,3,7,8' (interval list) into a
+# scale table, None for illegal keys
+def parseScale(key):
+    if key is None:
+        return ScaleTable(basicNote.get('c'), range(12), chromatic=True)
     m = re.match('^([a-hA-H]#?)(5?)$', key)
-    if not m:
-        # chromatic scale
-        return basicNote.get('c') + note
-
-    if m.group(2):
-        scale = pentaScale
-    elif key[0].isupper():
-        scale = majorScale
+    if m:
+        if m.group(2):
+            scale = pentaScale
+        elif key[0].isupper():
+            scale = majorScale
+        else:
+            scale = minorScale
     else:
-        scale = minorScale
-    
+        m = re.match('^([a-hA-H]#?):([a-z]+|\d+(,\d+)*)$', key)
+        if not m:
+            return None
+        spec = m.group(2)
+        if spec[0].isdigit():
+            scale = sorted(set([int(i) % 12 for i in spec.split(',')]))
+        else:
+            scale = namedScales.get(spec)
+            if scale is None:
+                return None
     tonality = m.group(1)
     base = basicNote.get(tonality.lower(), 36)
-    baseOctave = base + 12 * (note / len(scale))
-    def frameNote(x):
-        return max(1, min(127, x))
-    return frameNote(baseOctave + scale[note % len(scale)])
+    return ScaleTable(base, scale)
+
+scaleTables = {}
+
+# cached scale table for a key, illegal keys give the chromatic scale
+def scaleTable(key):
+    table = scaleTables.get(key)
+    if table is None:
+        table = parseScale(key)
+        if table is None:
+            table = parseScale(None)
+        scaleTables[key] = table
+    return table
+
+# get MIDI code for a note restricted to a specific scale.
+# note = 0 returns the basic note, negative and positive values 
+# will move down and up on the scale
+def noteOnScale(key = None, note = 0):
+    return scaleTable(key).note(note)
     
 
 # get a dictionary of all active MIDI devices, mapping names to device numbers